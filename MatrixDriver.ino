@@ -15,80 +15,454 @@
 
 CRGB leds[NUM_LEDS];
 
-// ----------  Layout (serpentine – edit if you have a different wiring)
+// ----------  Layout – must match WIRING in Matrix_Painter.py
+// Frames arrive in wire order, so this only matters for CMD_PIXEL. Tiled
+// panels and coordinate maps are handled by the host alone.
+#define WIRING_SERPENTINE           0   // even rows →, odd rows ←
+#define WIRING_PROGRESSIVE          1   // every row →
+#define WIRING_COLUMN_MAJOR         2   // every column ↓
+#define WIRING_VERTICAL_SERPENTINE  3   // even columns ↓, odd columns ↑
+#define WIRING      WIRING_SERPENTINE
+
 static uint16_t XY(uint8_t x, uint8_t y) {
+#if WIRING == WIRING_PROGRESSIVE
+  return y * COLS + x;
+#elif WIRING == WIRING_COLUMN_MAJOR
+  return x * ROWS + y;
+#elif WIRING == WIRING_VERTICAL_SERPENTINE
+  return x * ROWS + ((x & 1) ? (ROWS - 1 - y) : y);
+#else
   return (y * COLS) + ((y & 1) ? (COLS - 1 - x) : x);
+#endif
 }
 
 // ----------  Serial protocol ----------
 enum Cmd : uint8_t {
   CMD_FRAME    = 0xFF,   // full frame  (R,G,B …)
   CMD_PIXEL    = 0x01,   // single pixel (x,y,R,G,B)
-  CMD_BRIGHT   = 0x02    // set global brightness (0‑255)
+  CMD_BRIGHT   = 0x02,   // set global brightness (0‑255)
+  CMD_SPANS    = 0x03,   // span update: count, then per span
+                         //   off_hi off_lo len (R,G,B × len)
+  CMD_RLE      = 0x04,   // run‑length frame: (len,R,G,B) … until NUM_LEDS
+  CMD_PALETTE  = 0x05,   // palette frame: count (0 = 256), R,G,B × count,
+                         //   then one palette index per LED
+  CMD_HOLD     = 0x06,   // 1 = keep frames back until CMD_SHOW, 0 = show now
+  CMD_SHOW     = 0x07,   // show the held frame (frame id) – lets several
+                         //   controllers switch to the same frame together
+  CMD_BAUD     = 0x08,   // switch baud rate (4 bytes, big‑endian) after
+                         //   the ACK; sending the current rate confirms it
+  CMD_PROBE    = 0x09,   // link test: len, then len bytes checked by the CRC
+  CMD_HELLO    = 0x0A    // bare byte: print the ready banner again
 };
 
+// ----------  Ready banner ----------
+// One text line sent at start‑up and on CMD_HELLO, e.g.
+//   MatrixDriver proto=1 rows=9 cols=22 caps=frame,pixel,…
+// The host waits for it instead of a fixed reset delay and learns the
+// matrix size from it. It never contains the ACK/NAK reply bytes.
+#define CAPS  "frame,pixel,bright,spans,rle,palette,hold,show,framed,baud,probe"
+
+
+// ----------  Packet framing ----------
+// SYNC0 SYNC1 VER SEQ LEN_HI LEN_LO <LEN bytes of commands> CRC_HI CRC_LO
+// The CRC‑16/CCITT (poly 0x1021, init 0xFFFF) covers VER … last command byte.
+// Every packet is answered with REPLY_ACK or REPLY_NAK followed by its SEQ;
+// the ACK is sent after FastLED.show(), so it doubles as a send credit.
+// Bare commands without framing are still accepted for old hosts, until
+// the first good packet shows that the host speaks the framed protocol.
+#define SYNC0             0xA5
+#define SYNC1             0x5A
+#define PROTOCOL_VERSION  1
+#define REPLY_ACK         0x06
+#define REPLY_NAK         0x15
+#define MAX_PAYLOAD       ((NUM_LEDS * 3 + 16) > 260 ? (NUM_LEDS * 3 + 16) : 260)
+                       // host never sends more than a full frame or a probe
+#define BYTE_TIMEOUT_MS   50   // gap that aborts a half‑received packet
+
+// ----------  Baud negotiation ----------
+#define DEFAULT_BAUD      115200
+#define BAUD_FALLBACK_MS  2000   // unconfirmed rate reverts to DEFAULT_BAUD
+
+uint32_t currentBaud = DEFAULT_BAUD;
+uint32_t baudFallbackAt = 0;         // 0 = current rate is confirmed
+
+CRGB palette[256];                   // colours of the last CMD_PALETTE
+
 uint32_t lastRecv = 0;               // watchdog – clears after a while
 
+// ----------  Command decoder ----------
+static enum { WAIT_CMD, WAIT_FRAME, WAIT_PIXEL, WAIT_BRIGHT,
+              WAIT_SPAN_COUNT, WAIT_SPAN_HDR, WAIT_SPAN_DATA,
+              WAIT_RLE, WAIT_PAL_COUNT, WAIT_PAL_COLORS,
+              WAIT_PAL_INDEX, WAIT_HOLD, WAIT_SHOW, WAIT_BAUD,
+              WAIT_PROBE_LEN, WAIT_PROBE } state = WAIT_CMD;
+static uint16_t framePos = 0;        // bytes already stored for a frame
+static uint8_t  spansLeft = 0;       // spans still to come in this packet
+static uint8_t  spanHdr[3];          // off_hi off_lo len
+static uint8_t  spanHdrPos = 0;
+static uint8_t  rleBuf[4];           // len R G B
+static uint8_t  rlePos = 0;
+static uint8_t  pixBuf[5];           // x y r g b
+static uint8_t  pixIdx = 0;
+static uint16_t palCount = 0;        // colours in the palette being received
+static bool     showPending = false; // leds[] changed since the last show
+static int16_t  pendingBright = -1;  // brightness to apply on commit
+static bool     holdFrames = false;  // wait for CMD_SHOW before showing
+static bool     showNow = false;     // CMD_SHOW received
+static uint8_t  shownFrameId = 0;    // id of the last CMD_SHOW
+static uint8_t  baudBuf[4];
+static uint8_t  baudPos = 0;
+static uint32_t pendingBaud = 0;     // rate to switch to after the ACK
+static uint8_t  probeLeft = 0;
+
+static void resetDecoder() {
+  state = WAIT_CMD;
+  spanHdrPos = rlePos = pixIdx = baudPos = 0;
+}
+
+// Apply what the decoded commands asked for
+static void commit() {
+  if (pendingBright >= 0) {
+    FastLED.setBrightness(pendingBright);
+    pendingBright = -1;
+    showPending = true;     // optional – forces an update
+  }
+  if (showPending && (!holdFrames || showNow)) {
+    FastLED.show();
+    showPending = false;
+  }
+  showNow = false;
+}
+
+// Forget what a bad packet asked for
+static void discardPacket() {
+  resetDecoder();
+  showPending = false;
+  pendingBright = -1;
+  showNow = false;
+  pendingBaud = 0;
+}
+
+// Feed one byte to the command decoder. leds[] is updated in place, the
+// show is left to commit(). Returns true when a command has completed.
+static bool decodeByte(uint8_t b) {
+  switch (state) {
+    case WAIT_CMD:
+      if (b == CMD_FRAME) { framePos = 0; state = WAIT_FRAME; }
+      else if (b == CMD_PIXEL) { pixIdx = 0; state = WAIT_PIXEL; }
+      else if (b == CMD_BRIGHT) { state = WAIT_BRIGHT; }
+      else if (b == CMD_SPANS) { state = WAIT_SPAN_COUNT; }
+      else if (b == CMD_RLE) { framePos = 0; rlePos = 0; state = WAIT_RLE; }
+      else if (b == CMD_PALETTE) { state = WAIT_PAL_COUNT; }
+      else if (b == CMD_HOLD) { state = WAIT_HOLD; }
+      else if (b == CMD_SHOW) { state = WAIT_SHOW; }
+      else if (b == CMD_BAUD) { baudPos = 0; state = WAIT_BAUD; }
+      else if (b == CMD_PROBE) { state = WAIT_PROBE_LEN; }
+      return false;
+
+    case WAIT_FRAME:          // fill the whole LED buffer
+      {
+        uint16_t idx = framePos / 3;
+        uint8_t chan = framePos % 3;
+        if (idx < NUM_LEDS) {
+          if (chan == 0) leds[idx].r = b;
+          else if (chan == 1) leds[idx].g = b;
+          else leds[idx].b = b;
+        }
+        ++framePos;
+        if (framePos >= NUM_LEDS * 3) {
+          showPending = true;
+          state = WAIT_CMD;
+          return true;
+        }
+      }
+      return false;
+
+    case WAIT_PIXEL:          // expect exactly 5 more bytes: x y r g b
+      pixBuf[pixIdx++] = b;
+      if (pixIdx == 5) {
+        uint8_t x = pixBuf[0];
+        uint8_t y = pixBuf[1];
+        if (x < COLS && y < ROWS) {
+          uint16_t i = XY(x, y);
+          leds[i] = CRGB(pixBuf[2], pixBuf[3], pixBuf[4]);
+          showPending = true;           // immediate update of that pixel
+        }
+        pixIdx = 0;
+        state = WAIT_CMD;
+        return true;
+      }
+      return false;
+
+    case WAIT_BRIGHT:         // one byte = new brightness
+      pendingBright = b;
+      state = WAIT_CMD;
+      return true;
+
+    case WAIT_SPAN_COUNT:     // number of spans in this packet
+      spansLeft = b;
+      spanHdrPos = 0;
+      state = spansLeft ? WAIT_SPAN_HDR : WAIT_CMD;
+      return !spansLeft;
+
+    case WAIT_SPAN_HDR:       // 16‑bit start LED + 8‑bit length
+      spanHdr[spanHdrPos++] = b;
+      if (spanHdrPos == 3) {
+        framePos = ((uint16_t)spanHdr[0] << 8 | spanHdr[1]) * 3;
+        spanHdrPos = 0;
+        if (spanHdr[2]) {
+          state = WAIT_SPAN_DATA;
+        } else if (--spansLeft == 0) {
+          showPending = true;
+          state = WAIT_CMD;
+          return true;
+        }
+      }
+      return false;
+
+    case WAIT_SPAN_DATA:      // R,G,B for each LED of the span
+      {
+        uint16_t idx = framePos / 3;
+        uint8_t chan = framePos % 3;
+        if (idx < NUM_LEDS) {
+          if (chan == 0) leds[idx].r = b;
+          else if (chan == 1) leds[idx].g = b;
+          else leds[idx].b = b;
+        }
+        ++framePos;
+        if (chan == 2 && --spanHdr[2] == 0) {
+          if (--spansLeft == 0) {
+            showPending = true; // one show for the whole packet
+            state = WAIT_CMD;
+            return true;
+          }
+          state = WAIT_SPAN_HDR;
+        }
+      }
+      return false;
+
+    case WAIT_RLE:            // framePos counts LEDs here
+      rleBuf[rlePos++] = b;
+      if (rlePos == 4) {
+        rlePos = 0;
+        CRGB c(rleBuf[1], rleBuf[2], rleBuf[3]);
+        for (uint8_t n = rleBuf[0]; n && framePos < NUM_LEDS; --n)
+          leds[framePos++] = c;
+        if (framePos >= NUM_LEDS) {
+          showPending = true;
+          state = WAIT_CMD;
+          return true;
+        }
+      }
+      return false;
+
+    case WAIT_PAL_COUNT:
+      palCount = b ? b : 256;
+      framePos = 0;           // counts palette bytes, then LEDs
+      state = WAIT_PAL_COLORS;
+      return false;
+
+    case WAIT_PAL_COLORS:
+      {
+        uint8_t i = framePos / 3;
+        uint8_t chan = framePos % 3;
+        if (chan == 0) palette[i].r = b;
+        else if (chan == 1) palette[i].g = b;
+        else palette[i].b = b;
+        if (++framePos >= palCount * 3) {
+          framePos = 0;
+          state = WAIT_PAL_INDEX;
+        }
+      }
+      return false;
+
+    case WAIT_PAL_INDEX:
+      leds[framePos++] = palette[b];
+      if (framePos >= NUM_LEDS) {
+        showPending = true;
+        state = WAIT_CMD;
+        return true;
+      }
+      return false;
+
+    case WAIT_HOLD:
+      holdFrames = b;
+      state = WAIT_CMD;
+      return true;
+
+    case WAIT_SHOW:
+      shownFrameId = b;
+      showNow = true;
+      state = WAIT_CMD;
+      return true;
+
+    case WAIT_BAUD:
+      baudBuf[baudPos++] = b;
+      if (baudPos == 4) {
+        pendingBaud = (uint32_t)baudBuf[0] << 24 | (uint32_t)baudBuf[1] << 16 |
+                      (uint32_t)baudBuf[2] << 8 | baudBuf[3];
+        state = WAIT_CMD;
+        return true;
+      }
+      return false;
+
+    case WAIT_PROBE_LEN:
+      probeLeft = b;
+      state = probeLeft ? WAIT_PROBE : WAIT_CMD;
+      return !probeLeft;
+
+    case WAIT_PROBE:          // content only matters to the packet CRC
+      if (--probeLeft == 0) {
+        state = WAIT_CMD;
+        return true;
+      }
+      return false;
+  }
+  return false;
+}
+
+// ----------  Packet receiver ----------
+static void setBaud(uint32_t rate) {
+  Serial.flush();           // let the ACK leave at the old rate
+  Serial.end();
+  Serial.begin(rate);
+  currentBaud = rate;
+}
+
+static void switchBaud() {
+  uint32_t rate = pendingBaud;
+  pendingBaud = 0;
+  if (rate == currentBaud) {          // host confirms the rate it probed
+    baudFallbackAt = 0;
+    return;
+  }
+  setBaud(rate);
+  baudFallbackAt = millis() + BAUD_FALLBACK_MS;
+  if (!baudFallbackAt) baudFallbackAt = 1;
+}
+
+static uint16_t crc16Update(uint16_t crc, uint8_t b) {
+  crc ^= (uint16_t)b << 8;
+  for (uint8_t i = 0; i < 8; ++i)
+    crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+  return crc;
+}
+
+static void sendBanner() {
+  Serial.print(F("MatrixDriver proto="));
+  Serial.print(PROTOCOL_VERSION);
+  Serial.print(F(" rows="));
+  Serial.print(ROWS);
+  Serial.print(F(" cols="));
+  Serial.print(COLS);
+  Serial.println(F(" caps=" CAPS));
+}
+
+static void reply(uint8_t code, uint8_t seq) {
+  Serial.write(code);
+  Serial.write(seq);
+}
+
 void receiveSerial() {
-  static enum { WAIT_CMD, WAIT_FRAME, WAIT_PIXEL, WAIT_BRIGHT } state = WAIT_CMD;
-  static uint16_t framePos = 0;      // bytes already stored for a frame
+  static enum { PKT_NONE, PKT_SYNC1, PKT_HEADER, PKT_PAYLOAD,
+                PKT_CRC } pkt = PKT_NONE;
+  static uint8_t  hdr[4];            // VER SEQ LEN_HI LEN_LO
+  static uint8_t  hdrPos = 0;
+  static uint16_t payloadLeft = 0;
+  static uint16_t crc = 0xFFFF;
+  static uint16_t rxCrc = 0;
+  static uint8_t  crcPos = 0;
+  static bool     framedHost = false;  // after the first good packet, bare
+                                       // commands are treated as noise
+
+  // A packet or command that stopped half way will never complete: drop it
+  // so the host gets its NAK instead of waiting for a credit, and line noise
+  // cannot leave the decoder expecting the rest of a frame
+  if ((pkt != PKT_NONE || state != WAIT_CMD) &&
+      millis() - lastRecv > BYTE_TIMEOUT_MS) {
+    if (pkt >= PKT_PAYLOAD) reply(REPLY_NAK, hdr[1]);
+    discardPacket();
+    pkt = PKT_NONE;
+  }
 
   while (Serial.available()) {
     uint8_t b = Serial.read();
+    lastRecv = millis();
 
-    switch (state) {
-      case WAIT_CMD:
-        if (b == CMD_FRAME) { framePos = 0; state = WAIT_FRAME; }
-        else if (b == CMD_PIXEL) { state = WAIT_PIXEL; }
-        else if (b == CMD_BRIGHT) { state = WAIT_BRIGHT; }
+    switch (pkt) {
+      case PKT_NONE:
+        if (state == WAIT_CMD && b == SYNC0) {
+          pkt = PKT_SYNC1;
+        } else if (state == WAIT_CMD && b == CMD_HELLO) {
+          sendBanner();           // also after framing, for a host that
+                                  // reconnects without resetting the board
+        } else if (framedHost) {
+          // ignore noise between packets
+        } else if (decodeByte(b)) {
+          commit();               // bare command – apply immediately
+          pendingBaud = 0;        // rate changes need a checked packet
+        }
         break;
 
-      case WAIT_FRAME:          // fill the whole LED buffer
-        {
-          uint16_t idx = framePos / 3;
-          uint8_t chan = framePos % 3;
-          if (idx < NUM_LEDS) {
-            if (chan == 0) leds[idx].r = b;
-            else if (chan == 1) leds[idx].g = b;
-            else leds[idx].b = b;
-          }
-          ++framePos;
-          if (framePos >= NUM_LEDS * 3) {
-            FastLED.show();
-            state = WAIT_CMD;
-          }
+      case PKT_SYNC1:
+        if (b == SYNC1) {
+          hdrPos = 0;
+          crc = 0xFFFF;
+          pkt = PKT_HEADER;
+        } else {
+          pkt = (b == SYNC0) ? PKT_SYNC1 : PKT_NONE;   // resync
         }
         break;
 
-      case WAIT_PIXEL:          // expect exactly 5 more bytes: x y r g b
-        {
-          static uint8_t pixBuf[5];
-          static uint8_t pixIdx = 0;
-          pixBuf[pixIdx++] = b;
-          if (pixIdx == 5) {
-            uint8_t x = pixBuf[0];
-            uint8_t y = pixBuf[1];
-            if (x < COLS && y < ROWS) {
-              uint16_t i = XY(x, y);
-              leds[i] = CRGB(pixBuf[2], pixBuf[3], pixBuf[4]);
-              FastLED.show();               // immediate update of that pixel
-            }
-            pixIdx = 0;
-            state = WAIT_CMD;
+      case PKT_HEADER:
+        hdr[hdrPos++] = b;
+        crc = crc16Update(crc, b);
+        if (hdrPos == 4) {
+          payloadLeft = (uint16_t)hdr[2] << 8 | hdr[3];
+          if (hdr[0] != PROTOCOL_VERSION || payloadLeft > MAX_PAYLOAD) {
+            pkt = PKT_NONE;       // not a packet after all – hunt for sync
+          } else {
+            resetDecoder();
+            crcPos = 0;
+            pkt = payloadLeft ? PKT_PAYLOAD : PKT_CRC;
           }
         }
         break;
 
-      case WAIT_BRIGHT:         // one byte = new brightness
-        FastLED.setBrightness(b);
-        FastLED.show();         // optional – forces an update
-        state = WAIT_CMD;
+      case PKT_PAYLOAD:
+        crc = crc16Update(crc, b);
+        decodeByte(b);
+        if (--payloadLeft == 0) pkt = PKT_CRC;
+        break;
+
+      case PKT_CRC:
+        rxCrc = (rxCrc << 8) | b;
+        if (++crcPos == 2) {
+          if (rxCrc == crc && state == WAIT_CMD) {
+            commit();
+            reply(REPLY_ACK, hdr[1]);
+            framedHost = true;
+            if (pendingBaud) switchBaud();   // only after the ACK is out
+          } else {
+            // Corrupted: leds[] may hold part of it but is not shown; the
+            // host answers a NAK with a complete frame
+            discardPacket();
+            reply(REPLY_NAK, hdr[1]);
+          }
+          resetDecoder();
+          pkt = PKT_NONE;
+        }
         break;
     }
-    lastRecv = millis();
   }
 
-  // Optional watchdog: clear after 5 s of silence (helps after a disconnect)
+  // A rate the host never confirmed probably does not work – go back
+  if (baudFallbackAt && (int32_t)(millis() - baudFallbackAt) >= 0) {
+    setBaud(DEFAULT_BAUD);
+    baudFallbackAt = 0;
+  }
+
+  // Optional watchdog: clear after 5 s of silence (helps after a disconnect)
   if (millis() - lastRecv > 5000) {
     fill_solid(leds, NUM_LEDS, CRGB::Black);
     FastLED.show();
@@ -102,8 +476,9 @@ void setup() {
   FastLED.setBrightness(DEFAULT_BRIGHTNESS);
   FastLED.clear();
 
-  Serial.begin(115200);
+  Serial.begin(DEFAULT_BAUD);
   while (!Serial) ;          // wait for USB‑CDC enumeration
+  sendBanner();              // tells the host we are ready
 }
 void loop() {
   receiveSerial();           // non‑blocking – runs forever
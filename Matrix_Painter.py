@@ -7,76 +7,1672 @@ import math
 import json
 import random
 import copy
-from PIL import Image
+from PIL import Image, ImageTk
+import numpy as np
 import colorsys
 from datetime import datetime
+import threading
+import collections
+import binascii
+import concurrent.futures
+import socket
+import struct
+import types
+import os
+import argparse
+import abc
 
 # ======================  USER SETTINGS  ======================
 ROWS = 9
 COLS = 22
-SCALE = 20
+SCALE = 20              # canvas pixels per LED, shrunk to fit MAX_CANVAS
+MAX_CANVAS = (1000, 600)
 DEFAULT_BRIGHT = 32
+WIRING = 'serpentine'   # a name from WIRINGS or the path of a wiring file
+PREVIEW = 'image'       # 'image': one bitmap per frame, 'cells': a rectangle per LED
+RENDER_FPS = 60         # most animation/effect steps per second
+PREVIEW_FPS = 30        # most canvas repaints per second
+OUTPUT_FPS = 60         # most frames per second sent to the LEDs
+EFFECT_CACHE_MB = 64    # memory for replaying baked effect loops
+RENDER_THREADS = 0      # threads drawing bands of large frames, 0: one per core
+BAND_MIN_LEDS = 4096    # smaller frames are drawn in one piece
 # ===============================================================
 
 # ======================  SERIAL WRAPPER  ======================
-class SerialLink:
-    def __init__(self, port, baud=115200):
-        self.ser = serial.Serial(port, baud, timeout=0)
-        time.sleep(2)
+# Command bytes understood by MatrixDriver.ino
+CMD_FRAME = 0xFF     # full frame  (R,G,B …)
+CMD_PIXEL = 0x01     # single pixel (x,y,R,G,B)
+CMD_BRIGHT = 0x02    # global brightness (0-255)
+CMD_SPANS = 0x03     # span update (count, [off_hi, off_lo, len, R,G,B …] …)
+CMD_RLE = 0x04       # run-length frame ([len, R,G,B] … until every LED is set)
+CMD_PALETTE = 0x05   # palette frame (count, R,G,B × count, 1 index per LED)
+CMD_HOLD = 0x06      # 1: keep frames back until CMD_SHOW, 0: show at once
+CMD_SHOW = 0x07      # show the held frame (frame id)
+CMD_BAUD = 0x08      # switch baud rate (4 bytes, big-endian)
+CMD_PROBE = 0x09     # link test (len, len bytes); only the CRC checks them
+CMD_HELLO = 0x0A     # bare byte: the driver prints its ready banner again
+
+MAX_SPAN_LEN = 255   # LEDs per span (1 length byte)
+MAX_SPANS = 255      # spans per CMD_SPANS packet (1 count byte)
+MAX_RUN = 255        # LEDs per CMD_RLE run (1 length byte)
+MAX_PALETTE = 256    # colours per CMD_PALETTE frame (count 0 means 256)
+KEYFRAME_AFTER = 4.0 # s of silence before resending a full frame
+                     # (the driver blanks itself after 5 s without data)
+
+# Packet framing: SYNC VER SEQ LEN_HI LEN_LO <commands> CRC_HI CRC_LO
+SYNC = b'\xA5\x5A'
+PROTOCOL_VERSION = 1
+REPLY_ACK = 0x06     # followed by the SEQ of the packet that was shown
+REPLY_NAK = 0x15     # followed by the SEQ of a packet that failed its CRC
+ACK_TIMEOUT = 0.25   # s before an unanswered packet is given up on
+
+# Baud negotiation: the driver switches on CMD_BAUD and goes back to
+# DEFAULT_BAUD after BAUD_FALLBACK seconds unless the host confirms the new
+# rate by sending CMD_BAUD with it again
+DEFAULT_BAUD = 115200
+BAUD_RATES = (2000000, 1000000, 500000, 250000)   # exact on 16 MHz AVRs
+BAUD_FALLBACK = 2.0
+PROBE_PACKETS = 8
+PROBE_BYTES = 250
+# Ready banner: "MatrixDriver proto=1 rows=9 cols=22 caps=frame,pixel,…",
+# printed by the driver when it starts and on CMD_HELLO
+BANNER = b'MatrixDriver'
+READY_TIMEOUT = 3.0  # s to wait for the banner (an Uno's bootloader takes ~1.6)
+HELLO_INTERVAL = 0.5 # s between CMD_HELLOs while waiting
+LEGACY_CAPS = frozenset(('frame', 'pixel', 'bright'))   # drivers without banner
+# USB vendor ids of Arduinos and the usual USB-serial chips on clones
+BOARD_VIDS = {0x2341: 'Arduino', 0x2A03: 'Arduino', 0x1A86: 'CH340',
+              0x0403: 'FTDI', 0x10C4: 'CP210x'}
+PORT_SETTINGS = os.path.join(os.path.expanduser('~'), '.matrix_painter_ports.json')
+
+# ShardedOutput negotiates its links in parallel, so saves must not interleave
+_port_settings_lock = threading.Lock()
+
+def load_port_settings():
+    try:
+        with open(PORT_SETTINGS, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_port_setting(port, key, value):
+    with _port_settings_lock:
+        settings = load_port_settings()
+        settings.setdefault(port, {})[key] = value
+        # Write a temp file and swap it in, so readers never see half a file
+        temp = f'{PORT_SETTINGS}.{os.getpid()}.tmp'
+        try:
+            with open(temp, 'w') as f:
+                json.dump(settings, f, indent=2)
+            os.replace(temp, PORT_SETTINGS)
+        except OSError:
+            pass   # only a hint for the next connect
+
+def parse_banner(line):
+    """Read a ready banner into {'proto', 'rows', 'cols', 'caps'}; None if
+    the line is not one"""
+    words = bytes(line).strip().split()
+    if not words or words[0] != BANNER:
+        return None
+    fields = dict(w.decode('ascii', 'replace').partition('=')[::2]
+                  for w in words[1:])
+    try:
+        return {'proto': int(fields['proto']), 'rows': int(fields['rows']),
+                'cols': int(fields['cols']),
+                'caps': frozenset(fields.get('caps', '').split(','))}
+    except (KeyError, ValueError):
+        return None
+
+def scan_ports():
+    """List serial ports as (device, description), likely boards first"""
+    ports = []
+    for p in serial.tools.list_ports.comports():
+        chip = BOARD_VIDS.get(p.vid)
+        description = p.description if p.description not in (None, 'n/a') else ''
+        if chip and chip not in description:
+            description = f'{description} ({chip})'.strip()
+        ports.append((chip is None, p.device, description))
+    return [(device, description) for _, device, description in sorted(ports)]
+
+def frame_packet(seq, payload):
+    """Wrap commands in a packet with sync word, length, sequence and CRC-16"""
+    body = bytes([PROTOCOL_VERSION, seq & 0xFF,
+                  len(payload) >> 8, len(payload) & 0xFF]) + payload
+    crc = binascii.crc_hqx(body, 0xFFFF)   # CRC-16/CCITT-FALSE
+    return SYNC + body + bytes([crc >> 8, crc & 0xFF])
+
+def _leds(buf):
+    """(n, 3) uint8 view of a wire-order RGB buffer"""
+    return np.frombuffer(buf, np.uint8, len(buf) // 3 * 3).reshape(-1, 3)
+
+def diff_spans(old, new):
+    """Return (first_led, count) runs of LEDs that differ between two frames.
+
+    Both frames are wire-order RGB buffers of the same length. Runs separated
+    by a single unchanged LED are merged, because resending 3 bytes of colour
+    costs the same as a new span header.
+    """
+    changed = np.flatnonzero((_leds(old) != _leds(new)).any(axis=1))
+    if not len(changed):
+        return []
+    # Groups of changed LEDs at most one unchanged LED apart
+    breaks = np.flatnonzero(np.diff(changed) > 2) + 1
+    heads = np.concatenate(([0], breaks))
+    tails = np.concatenate((breaks, [len(changed)])) - 1
+    starts, lasts = changed[heads], changed[tails]
+    long = np.flatnonzero(lasts - starts >= MAX_SPAN_LEN)
+    if not len(long):
+        return list(zip(starts.tolist(), (lasts - starts + 1).tolist()))
+    # Cut groups longer than MAX_SPAN_LEN, each piece starting at a changed LED
+    spans = []
+    done = 0
+    for g in long.tolist():
+        spans += zip(starts[done:g].tolist(),
+                     (lasts[done:g] - starts[done:g] + 1).tolist())
+        group = changed[heads[g]:tails[g] + 1]
+        head = 0
+        while head < len(group):
+            first = group[head]
+            end = int(np.searchsorted(group, first + MAX_SPAN_LEN))
+            spans.append((int(first), int(group[end - 1] - first + 1)))
+            head = end
+        done = g + 1
+    spans += zip(starts[done:].tolist(),
+                 (lasts[done:] - starts[done:] + 1).tolist())
+    return spans
+
+def encode_spans(buf, spans):
+    """Pack spans of a wire-order frame into one or more CMD_SPANS packets"""
+    if not spans:
+        return []
+    firsts, counts = np.array(spans, np.intp).T
+    n = len(firsts)
+    # Each span is a 3-byte header followed by its colours: gather the
+    # output bytes from the headers and the frame in one go
+    headers = np.stack((firsts >> 8, firsts & 0xFF, counts), axis=1)
+    lengths = 3 + 3 * counts
+    offsets = np.cumsum(lengths) - lengths
+    take = np.empty(offsets[-1] + lengths[-1], np.intp)
+    take[offsets[:, None] + np.arange(3)] = np.arange(n * 3).reshape(-1, 3)
+    led_offsets = np.cumsum(counts) - counts
+    leds = np.repeat(firsts - led_offsets, counts) + np.arange(counts.sum())
+    at = np.repeat(offsets + 3 - 3 * led_offsets, counts) + 3 * np.arange(len(leds))
+    take[at[:, None] + np.arange(3)] = n * 3 + 3 * leds[:, None] + np.arange(3)
+    data = np.concatenate((headers.astype(np.uint8).ravel(),
+                           np.frombuffer(buf, np.uint8)))[take]
+    packets = []
+    for p in range(0, n, MAX_SPANS):
+        last = min(p + MAX_SPANS, n) - 1
+        chunk = data[offsets[p]:offsets[last] + lengths[last]]
+        packets.append(bytes([CMD_SPANS, last - p + 1]) + chunk.tobytes())
+    return packets
+
+def encode_rle(buf):
+    """Pack a wire-order frame as a CMD_RLE packet of (length, R, G, B) runs"""
+    leds = _leds(buf)
+    if not len(leds):
+        return bytes([CMD_RLE])
+    starts = np.flatnonzero(np.concatenate(
+        ([True], (leds[1:] != leds[:-1]).any(axis=1))))
+    lengths = np.diff(np.append(starts, len(leds)))
+    # Runs longer than MAX_RUN go out as several runs of the same colour
+    pieces = -(-lengths // MAX_RUN)
+    runs = np.empty((pieces.sum(), 4), np.uint8)
+    runs[:, 0] = MAX_RUN
+    runs[np.cumsum(pieces) - 1, 0] = lengths - (pieces - 1) * MAX_RUN
+    runs[:, 1:] = np.repeat(leds[starts], pieces, axis=0)
+    return bytes([CMD_RLE]) + runs.tobytes()
+
+def encode_palette(buf):
+    """Pack a wire-order frame as a CMD_PALETTE packet.
+
+    Returns None when the frame uses more than MAX_PALETTE distinct colours.
+    """
+    leds = _leds(buf)
+    keys = (leds[:, 0].astype(np.uint32) << 16
+            | leds[:, 1].astype(np.uint32) << 8 | leds[:, 2])
+    if len(np.unique(keys[:4 * MAX_PALETTE])) > MAX_PALETTE:
+        return None                  # cheap early out for busy frames
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    if len(first) > MAX_PALETTE:
+        return None
+    # Palette in order of first use, as the per-LED loop used to build it
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    indices = rank[inverse.ravel()].astype(np.uint8)
+    return (bytes([CMD_PALETTE, len(first) & 0xFF])
+            + leds[first[order]].tobytes() + indices.tobytes())
+
+def encode_frame(buf, previous=None, caps=None):
+    """Return the shortest byte string that makes the board show `buf`.
+
+    Tries a full frame, RLE, palette and, when the frame the board currently
+    shows is known, a span delta against it; `caps` limits this to the
+    encodings the driver announced. An empty result means nothing changed.
+    """
+    candidates = [bytes([CMD_FRAME]) + bytes(buf)]
+    if caps is None or 'rle' in caps:
+        candidates.append(encode_rle(buf))
+    palette = (encode_palette(buf) if caps is None or 'palette' in caps
+               else None)
+    if palette is not None:
+        candidates.append(palette)
+    if previous is not None and len(previous) == len(buf):
+        spans = diff_spans(previous, buf)
+        if not spans:
+            return b''
+        if caps is None or 'spans' in caps:
+            candidates.append(b''.join(encode_spans(buf, spans)))
+    return min(candidates, key=len)
+
+class FrameMailbox:
+    """Single-slot hand-off between the renderer and a sender thread.
+
+    put() never blocks: a frame that has not been taken yet is replaced by the
+    newer one and counted as dropped.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._woken = False
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._cond.notify()
+
+    def wake(self):
+        """Wake the waiting thread without handing it a frame"""
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """Wait for the newest frame; returns None on timeout, wake or close"""
+        with self._cond:
+            if self._frame is None and not self._woken and not self.closed:
+                self._cond.wait(timeout)
+            frame, self._frame = self._frame, None
+            self._woken = False
+            return frame
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+class Transport(abc.ABC):
+    """Base class for everything frames can be sent to.
+
+    Subclasses implement the blocking write_* methods. send_frame() and
+    set_brightness() hand the work to a sender thread through a
+    latest-frame-wins mailbox, so a slow link never stalls the caller.
+    Without start() they call write_* directly instead; ShardedOutput drives
+    its links from its own thread pool that way.
+    """
+    STATS_INTERVAL = 1.0   # s between updates of the rate counters
+    # Counters, written by the sender thread only
+    frames_lost = 0
+    bytes_sent = 0
+    # What the controller reported about itself; None/empty when unknown
+    rows = cols = None
+    caps = frozenset()
+    # The exception that stopped the sender thread, e.g. an unplugged board
+    error = None
+
+    def __init__(self):
+        self.mailbox = FrameMailbox()
+        self._commands = collections.deque()
+        self._thread = None
+        self.frames_sent = 0
+        self.frames_unchanged = 0   # already on the board, nothing written
+        self.frames_per_second = 0.0
+        self.bytes_per_second = 0.0
+
+    def start(self, name):
+        """Start the sender thread"""
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=name)
+        self._thread.start()
+
+    @property
+    def frames_dropped(self):
+        return self.mailbox.dropped
+
+    def close(self):
+        self.mailbox.close()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def send_frame(self, buf):
+        """Queue a wire-order frame for sending; never blocks"""
+        if self._thread:
+            self.mailbox.put(bytes(buf))
+        else:
+            self.write_frame(bytes(buf))
+
+    def set_brightness(self, val):
+        self._command(self.write_brightness, val & 0xFF)
+
+    def _command(self, fn, *args):
+        if not self._thread:
+            fn(*args)
+            return
+        self._commands.append((fn, args))
+        self.mailbox.wake()
+
+    # ---- implemented by subclasses ----
+    @abc.abstractmethod
+    def write_frame(self, buf):
+        """Send a frame now; returns False if nothing had to be written"""
+
+    @abc.abstractmethod
+    def write_brightness(self, val):
+        """Set the global brightness now"""
+
+    @abc.abstractmethod
+    def write_hold(self, hold):
+        """Keep frames back until write_show() while `hold` is set"""
+
+    @abc.abstractmethod
+    def write_show(self, frame_id):
+        """Show the frame that is being held"""
+
+    # ---- sender thread ----
+    def _run(self):
+        try:
+            self._send_loop()
+        except Exception as e:
+            # Keep the error for the owner to report; nothing more is sent
+            self.error = e
+            self.mailbox.close()
+
+    def _send_loop(self):
+        stats_time = time.monotonic()
+        stats_frames = stats_bytes = 0
+        while not self.mailbox.closed:
+            buf = self.mailbox.take(timeout=self.STATS_INTERVAL)
+            while self._commands:
+                fn, args = self._commands.popleft()
+                fn(*args)
+            if buf is not None:
+                self.write_frame(buf)
+
+            now = time.monotonic()
+            if now - stats_time >= self.STATS_INTERVAL:
+                elapsed = now - stats_time
+                sent = self.bytes_sent
+                self.frames_per_second = (self.frames_sent - stats_frames) / elapsed
+                self.bytes_per_second = (sent - stats_bytes) / elapsed
+                stats_time, stats_frames, stats_bytes = now, self.frames_sent, sent
+
+class SerialLink(Transport):
+    """Serial connection to MatrixDriver.ino.
+
+    With `framed` set every write is wrapped by frame_packet() and costs one
+    credit; the driver hands the credit back with its ACK once the frame is
+    shown. `window` credits are available, and the default of 1 means nothing
+    is sent while FastLED.show() has interrupts disabled on the board.
+
+    With `negotiate` set the link is moved to the fastest rate in BAUD_RATES
+    that passes a probe; see negotiate_baud().
+
+    Opening waits for the driver's ready banner (see wait_ready()), which
+    also fills in rows, cols and caps. A driver that never sends one is
+    treated as the original bare-command firmware: no framing, full frames
+    only.
+    """
+    def __init__(self, port, baud=DEFAULT_BAUD, framed=True, window=1,
+                 threaded=True, negotiate=True):
+        super().__init__()
+        self.port = port
+        self.ser = serial.Serial(port, baud, timeout=0.005)
+        self.framed = framed
+        self.window = window
+        self.last_frame = None   # last frame the board is known to show
+        self.last_write = 0.0
+        self._seq = 0
+        self._in_flight = collections.OrderedDict()   # seq -> time sent
+        self._reply_code = None  # reply byte still waiting for its SEQ
+        self.probe_bytes_per_second = 0.0
+        info = self.wait_ready()
+        saved = load_port_settings().get(port, {}).get('baud')
+        if info is None and saved and saved != baud:
+            # Reconnecting without a reset: the board may still be at the
+            # rate negotiated last time, which it had confirmed
+            self.ser.baudrate = saved
+            info = self.wait_ready(2 * HELLO_INTERVAL)
+            if info is None:
+                self.ser.baudrate = baud
+            else:
+                negotiate = False
+        if info is None:
+            self.caps = LEGACY_CAPS
+            self.framed = False
+        else:
+            self.rows, self.cols, self.caps = info['rows'], info['cols'], info['caps']
+            self.framed = framed and 'framed' in self.caps
+        if negotiate and self.framed and 'baud' in self.caps:
+            self.negotiate_baud()
+        if threaded:
+            self.start(f'SerialLink {port}')
+
+    @property
+    def baud(self):
+        return self.ser.baudrate
 
     def close(self):
+        super().close()
         self.ser.close()
         
-    def send_full_frame(self, buf):
-        self.ser.write(bytearray([0xFF]) + buf)
-        
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """Wait for the ready banner; returns parse_banner()'s fields or None.
+
+        The banner comes by itself when opening the port resets the board.
+        CMD_HELLO is sent every HELLO_INTERVAL for boards that do not reset.
+        """
+        start = time.monotonic()
+        hello = start + HELLO_INTERVAL
+        line = bytearray()
+        while time.monotonic() - start < timeout and not self.mailbox.closed:
+            line += self.ser.read(self.ser.in_waiting or 1)
+            *lines, line = line.split(b'\n')
+            for text in lines:
+                info = parse_banner(text)
+                if info is not None:
+                    time.sleep(0.01)              # let repeated banners land
+                    self.ser.reset_input_buffer()
+                    return info
+            if time.monotonic() >= hello:
+                self.ser.write(bytes([CMD_HELLO]))
+                hello += HELLO_INTERVAL
+        return None
+
     def send_pixel(self, x, y, r, g, b):
-        self.ser.write(bytearray([0x01, x, y, r, g, b]))
-        
-    def set_brightness(self, val):
-        self.ser.write(bytearray([0x02, val & 0xFF]))
+        self._command(self.write_command, bytes([CMD_PIXEL, x, y, r, g, b]), True)
+
+    def write_command(self, data, changes_frame=False):
+        """Send raw command bytes now, from the calling thread"""
+        self._write(data)
+        if changes_frame:
+            self.last_frame = None
+
+    def write_brightness(self, val):
+        self.write_command(bytes([CMD_BRIGHT, val]))
+
+    def write_hold(self, hold):
+        self.write_command(bytes([CMD_HOLD, int(hold)]))
+
+    def write_show(self, frame_id):
+        self.write_command(bytes([CMD_SHOW, frame_id & 0xFF]))
+
+    def _write(self, data):
+        if self.framed:
+            self._wait_for_credit()
+            if self.mailbox.closed:
+                return
+            data = frame_packet(self._seq, data)
+            self._in_flight[self._seq] = time.monotonic()
+            self._seq = (self._seq + 1) & 0xFF
+        self.ser.write(data)
+        self.bytes_sent += len(data)
+        self.last_write = time.monotonic()
+
+    def _wait_for_credit(self, credits=1):
+        """Wait until `credits` are free; credits=window waits for every ACK"""
+        self._read_replies()
+        while (len(self._in_flight) > self.window - credits
+               and not self.mailbox.closed):
+            seq, sent = next(iter(self._in_flight.items()))
+            if time.monotonic() - sent > ACK_TIMEOUT:
+                del self._in_flight[seq]
+                self._packet_lost()
+            else:
+                self._read_replies(block=True)
+
+    def _read_replies(self, block=False):
+        """Collect ACK/NAK replies; blocks for one read timeout if asked to"""
+        waiting = self.ser.in_waiting
+        if not waiting and not block:
+            return
+        for b in self.ser.read(waiting or 1):
+            if self._reply_code is None:
+                if b in (REPLY_ACK, REPLY_NAK):
+                    self._reply_code = b
+                continue
+            code, self._reply_code = self._reply_code, None
+            if self._in_flight.pop(b, None) is not None and code == REPLY_NAK:
+                self._packet_lost()
+
+    def _packet_lost(self):
+        self.frames_lost += 1
+        self.last_frame = None   # resend everything in the next frame
+
+    # ---- baud negotiation ----
+    def negotiate_baud(self, rates=BAUD_RATES):
+        """Move the link to the fastest rate the board and adapter sustain.
+
+        Tries the rate that worked last time on this port first, then every
+        faster-than-current rate from fastest to slowest. Each attempt is
+        checked with probe(); a failed one drops back to the current rate.
+        Returns the rate in use afterwards.
+        """
+        start = self.baud
+        saved = load_port_settings().get(self.port, {}).get('baud')
+        candidates = [saved] if saved in rates else []
+        candidates += [r for r in rates if r != saved]
+        for rate in candidates:
+            if rate > start and self._try_baud(rate):
+                break
+        save_port_setting(self.port, 'baud', self.baud)
+        return self.baud
+
+    def _try_baud(self, rate):
+        old, lost = self.baud, self.frames_lost
+        self.write_command(struct.pack('>BI', CMD_BAUD, rate))
+        self._wait_for_credit(self.window)
+        if self.frames_lost != lost:
+            self.frames_lost = lost
+            return False     # board did not take the command
+        # The board switches, and starts its fallback timer, as it ACKs
+        fallback_at = time.monotonic() + BAUD_FALLBACK + 0.05
+        self.ser.baudrate = rate
+        time.sleep(0.01)     # the board re-opens its UART after the ACK
+        self.ser.reset_input_buffer()
+        if self.probe():
+            self.write_command(struct.pack('>BI', CMD_BAUD, rate))   # confirm
+            self._wait_for_credit(self.window)
+            if self.frames_lost == lost:
+                return True
+        # Let the board fall back on its own, then carry on at the old rate;
+        # the probes already used up part of the wait
+        self.frames_lost = lost
+        self.ser.baudrate = old
+        time.sleep(max(0.0, fallback_at - time.monotonic()))
+        self.ser.reset_input_buffer()
+        self._in_flight.clear()
+        self._reply_code = None
+        return False
+
+    def probe(self, packets=PROBE_PACKETS, size=PROBE_BYTES):
+        """Send test packets; True if every one came back ACKed.
+
+        Sets probe_bytes_per_second to the throughput that was measured.
+        """
+        lost = self.frames_lost
+        started = time.monotonic()
+        for _ in range(packets):
+            pattern = bytes(random.getrandbits(8) for _ in range(size))
+            self.write_command(bytes([CMD_PROBE, size]) + pattern)
+        self._wait_for_credit(self.window)
+        self.probe_bytes_per_second = packets * (size + 10) / (
+            time.monotonic() - started)
+        return self.frames_lost == lost
+
+    def write_frame(self, buf):
+        """Send a frame now using whichever encoding needs the fewest bytes.
+
+        Blocks the calling thread until a credit is free; returns False when
+        the board already shows this frame and nothing was written.
+        """
+        if self.framed:
+            self._wait_for_credit()   # a pending NAK must void the delta base
+        previous = self.last_frame
+        if time.monotonic() - self.last_write > KEYFRAME_AFTER:
+            previous = None
+        data = encode_frame(buf, previous, self.caps)
+        if data:
+            self._write(data)
+            self.last_frame = buf
+            self.frames_sent += 1
+        else:
+            self.frames_unchanged += 1
+        return bool(data)
+# ===============================================================
+
+# ======================  UDP TRANSPORT  ======================
+# DDP (Distributed Display Protocol) as spoken by WLED and most ESP32 firmwares
+DDP_PORT = 4048
+DDP_MAX_DATA = 1440   # bytes per packet: 480 RGB LEDs, fits a 1500-byte MTU
+DDP_VERSION1 = 0x40
+DDP_PUSH = 0x01       # display everything received so far
+DDP_TYPE_RGB24 = 0x0B
+DDP_ID_DISPLAY = 1
+DDP_HEADER = struct.Struct('>BBBBIH')   # flags seq type id offset length
+
+def ddp_packets(buf, seq, push=True, max_data=DDP_MAX_DATA):
+    """Split a wire-order frame into DDP packets; returns (packets, next_seq).
+
+    The 4-bit sequence number runs 1..15 (0 means unused). Only the last
+    packet carries the push flag, and only when `push` is set.
+    """
+    packets = []
+    for offset in range(0, len(buf), max_data):
+        chunk = buf[offset:offset + max_data]
+        flags = DDP_VERSION1
+        if push and offset + max_data >= len(buf):
+            flags |= DDP_PUSH
+        packets.append(DDP_HEADER.pack(flags, seq, DDP_TYPE_RGB24,
+                                       DDP_ID_DISPLAY, offset, len(chunk))
+                       + chunk)
+        seq = seq % 15 + 1
+    return packets, seq
+
+class UdpLink(Transport):
+    """Sends frames as DDP packets to a network controller.
+
+    One non-blocking socket is reused for every packet. Packets the OS
+    cannot take at once are counted as lost rather than waited for.
+    """
+    def __init__(self, host, port=DDP_PORT, max_data=DDP_MAX_DATA,
+                 threaded=True):
+        super().__init__()
+        self.address = (host, port)
+        self.max_data = max_data
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.caps = frozenset(('frame', 'bright', 'hold', 'show'))
+        self.hold = False
+        self.brightness = 255
+        self._dim = None       # byte translation table for brightness < 255
+        self._seq = 1
+        if threaded:
+            self.start(f'UdpLink {host}:{port}')
+
+    def close(self):
+        super().close()
+        self.sock.close()
+
+    def write_frame(self, buf):
+        if self._dim:
+            buf = buf.translate(self._dim)
+        packets, self._seq = ddp_packets(buf, self._seq, not self.hold,
+                                         self.max_data)
+        lost = False
+        for packet in packets:
+            lost |= not self._send(packet)
+        self.frames_lost += lost
+        self.frames_sent += 1
+        return True
+
+    def write_brightness(self, val):
+        # DDP has no brightness field, so scale the pixels instead
+        self.brightness = val
+        self._dim = (None if val >= 255 else
+                     bytes(v * val // 255 for v in range(256)))
+
+    def write_hold(self, hold):
+        self.hold = hold
+
+    def write_show(self, frame_id):
+        self._send(DDP_HEADER.pack(DDP_VERSION1 | DDP_PUSH, 0, DDP_TYPE_RGB24,
+                                   DDP_ID_DISPLAY, 0, 0))
+
+    def _send(self, packet):
+        try:
+            self.sock.sendto(packet, self.address)
+        except (BlockingIOError, InterruptedError):
+            return False
+        self.bytes_sent += len(packet)
+        return True
+
+def open_transport(port, baud=DEFAULT_BAUD, threaded=True):
+    """Open a SerialLink, or a UdpLink for ports written udp://host[:port]"""
+    if port.startswith('udp://'):
+        host, _, udp_port = port[len('udp://'):].partition(':')
+        return UdpLink(host, int(udp_port or DDP_PORT), threaded=threaded)
+    return SerialLink(port, baud, threaded=threaded)
+# ===============================================================
+
+# ======================  WIRING  ======================
+# A wiring map is a (rows, cols) int array holding the position along the
+# LED strip of every pixel, or -1 where no LED is fitted. It is compiled once;
+# FrameBuffer turns it into the gather that serialises each frame.
+WIRINGS = ('serpentine', 'progressive', 'column-major', 'vertical-serpentine')
+ROTATIONS = (0, 90, 180, 270)
+
+def wiring_map(rows, cols, wiring='serpentine'):
+    """Wiring map of a single panel.
+
+    serpentine: even rows left to right, odd rows right to left
+    progressive: every row left to right
+    column-major: every column top to bottom
+    vertical-serpentine: even columns top to bottom, odd columns bottom to top
+    """
+    if wiring in ('progressive', 'serpentine'):
+        leds = np.arange(rows * cols).reshape(rows, cols)
+    elif wiring in ('column-major', 'vertical-serpentine'):
+        leds = np.arange(rows * cols).reshape(cols, rows)
+    else:
+        raise ValueError(f'Unknown wiring {wiring!r}')
+    if wiring.endswith('serpentine'):
+        leds[1::2] = leds[1::2, ::-1]
+    return leds if wiring in ('progressive', 'serpentine') else leds.T
+
+def tiled_map(rows, cols, panels):
+    """Wiring map of panels chained one after another.
+
+    Each panel is {"x", "y", "width", "height", "wiring", "rotation"}: the
+    rectangle it covers on the matrix, the wiring it has when unrotated and
+    how far it is turned clockwise (0, 90, 180 or 270).
+    """
+    leds = np.full((rows, cols), -1)
+    first = 0
+    for n, panel in enumerate(panels):
+        x, y = panel['x'], panel['y']
+        width, height = panel['width'], panel['height']
+        rotation = panel.get('rotation', 0)
+        if rotation not in ROTATIONS:
+            raise ValueError(f'Panel {n}: rotation must be one of {ROTATIONS}')
+        if x < 0 or y < 0 or x + width > cols or y + height > rows:
+            raise ValueError(f'Panel {n} does not fit the {rows}×{cols} matrix')
+        if (leds[y:y + height, x:x + width] >= 0).any():
+            raise ValueError(f'Panel {n} overlaps another panel')
+        unrotated = (height, width) if rotation in (0, 180) else (width, height)
+        panel_leds = wiring_map(*unrotated, panel.get('wiring', 'serpentine'))
+        leds[y:y + height, x:x + width] = (
+            np.rot90(panel_leds, -rotation // 90) + first)
+        first += width * height
+    return leds
+
+def coordinate_map(rows, cols, coords):
+    """Wiring map from the [x, y] pixel of every LED, in strip order"""
+    leds = np.full((rows, cols), -1)
+    for n, (x, y) in enumerate(coords):
+        if not (0 <= x < cols and 0 <= y < rows):
+            raise ValueError(f'LED {n} at ({x}, {y}) is outside the matrix')
+        if leds[y, x] >= 0:
+            raise ValueError(f'LEDs {leds[y, x]} and {n} share pixel ({x}, {y})')
+        leds[y, x] = n
+    return leds
+
+def compile_wiring(rows, cols, spec='serpentine'):
+    """Wiring map from a name in WIRINGS, a wiring file path or its contents.
+
+    A wiring file holds one of
+        {"wiring": "<name>"}
+        {"panels": [{"x", "y", "width", "height", "wiring", "rotation"}, …]}
+        {"map": [[x, y], …]}       # pixel of LED 0, 1, 2, …
+    """
+    if isinstance(spec, str):
+        if spec in WIRINGS:
+            return wiring_map(rows, cols, spec)
+        with open(spec, 'r') as f:
+            spec = json.load(f)
+    if 'panels' in spec:
+        leds = tiled_map(rows, cols, spec['panels'])
+    elif 'map' in spec:
+        leds = coordinate_map(rows, cols, spec['map'])
+    else:
+        leds = wiring_map(rows, cols, spec.get('wiring', 'serpentine'))
+    fitted = np.sort(leds[leds >= 0])
+    if not np.array_equal(fitted, np.arange(len(fitted))):
+        raise ValueError('LED numbers must run from 0 without gaps')
+    return leds
+# ===============================================================
+
+# ======================  MATRIX PROFILES  ======================
+def fit_scale(rows, cols):
+    """Largest canvas scale up to SCALE that keeps the canvas in MAX_CANVAS"""
+    return max(2, min(SCALE, MAX_CANVAS[0] // cols, MAX_CANVAS[1] // rows))
+
+def load_profile(path):
+    """Read a matrix profile: {"rows", "cols", "scale", "wiring"}.
+
+    Missing keys keep the USER SETTINGS values. A wiring file named in the
+    profile is looked up next to it.
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    profile = {'rows': int(data.get('rows', ROWS)),
+               'cols': int(data.get('cols', COLS)),
+               'scale': data.get('scale'),
+               'wiring': data.get('wiring', WIRING)}
+    if profile['wiring'] not in WIRINGS and isinstance(profile['wiring'], str):
+        profile['wiring'] = os.path.join(os.path.dirname(path), profile['wiring'])
+    return profile
+
+def check_profile(profile):
+    """Raise ValueError if a profile's sizes cannot be drawn"""
+    if profile['rows'] < 1 or profile['cols'] < 1:
+        raise ValueError('rows and cols must be at least 1')
+    if profile['scale'] is not None and profile['scale'] < 1:
+        raise ValueError('scale must be at least 1')
 # ===============================================================
 
 # ======================  FRAME BUFFER  ==============
-frame = bytearray(ROWS * COLS * 3)
 animation_frames = []  # For recording animations
 recording = False
 playback_index = 0
 
-def idx(x, y):
-    if y & 1:
-        logical = y * COLS + (COLS - 1 - x)
+class FrameBuffer:
+    """RGB pixels in logical order: `pixels` is a (rows, cols, 3) uint8 array.
+
+    Drawing code works on `pixels` (or views of it) directly. to_wire()
+    reorders it into the byte order the driver expects with one gather
+    through an index table computed once from the wiring map (see WIRING).
+    """
+    def __init__(self, rows=ROWS, cols=COLS, wire_map=None):
+        self.rows, self.cols = rows, cols
+        self.pixels = np.zeros((rows, cols, 3), np.uint8)
+        self.displayed = None    # colours the preview shows, for take_dirty()
+        if wire_map is None:
+            wire_map = wiring_map(rows, cols)
+        self.wire_map = wire_map
+        # Logical pixel index of each LED along the wire
+        flat = wire_map.ravel()
+        fitted = np.flatnonzero(flat >= 0)
+        self.gather = np.empty(len(fitted), np.intp)
+        self.gather[flat[fitted]] = fitted
+
+    def clear(self):
+        self.pixels.fill(0)
+
+    def take_dirty(self):
+        """(ys, xs) of the pixels that changed since the last call.
+
+        The colours last handed out are kept, so a pixel that was cleared and
+        redrawn in the same colour does not count as changed.
+        """
+        if self.displayed is None:
+            self.displayed = np.zeros_like(self.pixels)
+            changed = np.ones((self.rows, self.cols), bool)
+        else:
+            changed = (self.pixels != self.displayed).any(axis=2)
+        ys, xs = np.nonzero(changed)
+        self.displayed[ys, xs] = self.pixels[ys, xs]
+        return ys, xs
+
+    def mark_dirty(self, blank=False):
+        """Make take_dirty() report every pixel, or with `blank` every pixel
+        that is not black"""
+        self.displayed = np.zeros_like(self.pixels) if blank else None
+
+    def fill(self, color, x=0, y=0, width=None, height=None):
+        """Fill the whole frame or a rectangle of it with one colour"""
+        self.view(x, y, width, height)[:] = color
+
+    def view(self, x=0, y=0, width=None, height=None):
+        """Writable (height, width, 3) window, clipped to the frame"""
+        x1 = self.cols if width is None else x + width
+        y1 = self.rows if height is None else y + height
+        return self.pixels[max(y, 0):max(y1, 0), max(x, 0):max(x1, 0)]
+
+    def blit(self, src, x=0, y=0):
+        """Copy a (h, w, 3) array to (x, y); parts outside the frame are cut"""
+        h, w = src.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.cols), min(y + h, self.rows)
+        if x0 < x1 and y0 < y1:
+            self.pixels[y0:y1, x0:x1] = src[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    def set(self, x, y, color):
+        if 0 <= x < self.cols and 0 <= y < self.rows:
+            self.pixels[y, x] = color
+
+    def get(self, x, y):
+        return tuple(int(v) for v in self.pixels[y, x])
+
+    def to_wire(self, pixels=None):
+        """Bytes for the driver, R,G,B per LED in wiring order"""
+        if pixels is None:
+            pixels = self.pixels
+        return pixels.reshape(-1, 3)[self.gather].tobytes()
+
+    def from_wire(self, data):
+        """(rows, cols, 3) array of a wire-order frame; short data is padded"""
+        leds = np.zeros((self.rows * self.cols, 3), np.uint8)
+        n = min(len(data), len(self.gather) * 3) // 3 * 3
+        wire = np.frombuffer(bytes(data[:n]), np.uint8).reshape(-1, 3)
+        leds[self.gather[:len(wire)]] = wire
+        return leds.reshape(self.rows, self.cols, 3)
+
+def scaled_image(pixels, scale):
+    """PIL image of a (rows, cols, 3) frame with every LED a scale×scale block"""
+    rows, cols = pixels.shape[:2]
+    return Image.fromarray(pixels).resize((cols * scale, rows * scale),
+                                          Image.NEAREST)
+# ===============================================================
+
+# ======================  SHARDED OUTPUT  ======================
+class Segment:
+    """Rectangle of the matrix driven by its own controller.
+
+    The controller's MatrixDriver.ino must be built with ROWS/COLS equal to
+    the segment's height/width; ShardedOutput checks its banner for that.
+    """
+    def __init__(self, port, x, y, width, height, wiring='serpentine',
+                 baud=DEFAULT_BAUD):
+        self.port = port
+        self.baud = baud
+        self.x, self.y = x, y
+        self.width, self.height = width, height
+        self.wiring = wiring
+        try:
+            # Segment pixel (row * width + col) of each LED along its strip
+            self.gather = FrameBuffer(height, width, compile_wiring(
+                height, width, wiring)).gather
+        except ValueError as e:
+            raise ValueError(f'Segment {port}: {e}') from None
+
+    def pixels(self, rows, cols):
+        """Pixel of a rows×cols matrix (row * cols + col) behind each LED"""
+        if (self.x < 0 or self.y < 0 or self.x + self.width > cols
+                or self.y + self.height > rows):
+            raise ValueError(f'Segment {self.port} does not fit the '
+                             f'{rows}×{cols} matrix')
+        row, col = np.divmod(self.gather, self.width)
+        return (self.y + row) * cols + self.x + col
+
+def load_layout(path):
+    """Read a layout file: {"segments": [{"port", "x", "y", "width",
+    "height", "wiring", "baud"}, …]}"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    segments = [Segment(**seg) for seg in data.get('segments', [])]
+    if not segments:
+        raise ValueError(f'{path} lists no segments')
+    return segments
+
+def check_segment(seg, link):
+    """Raise ValueError if a controller cannot drive its segment"""
+    if link.rows is not None and (link.rows, link.cols) != (seg.height,
+                                                            seg.width):
+        raise ValueError(f'{seg.port} drives {link.rows}×{link.cols} LEDs, '
+                         f'the layout needs {seg.height}×{seg.width}')
+    if not {'hold', 'show'} <= link.caps:
+        raise ValueError(f'{seg.port} cannot hold frames; update its driver')
+
+class ShardedOutput(Transport):
+    """Drives several controllers as one matrix.
+
+    Every frame is cut into segments that are written concurrently from a
+    thread pool. The controllers hold the frame until all writes are done
+    and are then told to show the same frame id, so they switch together.
+    """
+    def __init__(self, segments, wire_map=None):
+        super().__init__()
+        self.segments = segments
+        # Where each segment's LEDs sit in the wire-order frames sent here
+        if wire_map is None:
+            wire_map = wiring_map(ROWS, COLS)
+        self.gathers = [wire_map.ravel()[seg.pixels(*wire_map.shape)]
+                        for seg in segments]
+        for seg, gather in zip(segments, self.gathers):
+            if (gather < 0).any():
+                raise ValueError(f'Segment {seg.port} covers pixels without LEDs')
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(segments), thread_name_prefix='ShardedOutput')
+        # Opening waits for every board's reset, so open them side by side
+        self.links = list(self.pool.map(
+            lambda seg: open_transport(seg.port, seg.baud, threaded=False),
+            segments))
+        try:
+            for seg, link in zip(segments, self.links):
+                check_segment(seg, link)
+        except ValueError:
+            self._each(lambda link: link.close())
+            self.pool.shutdown()
+            raise
+        self._each(lambda link: link.write_hold(True))
+        self.frame_id = 0
+        self.start('ShardedOutput')
+
+    @property
+    def frames_lost(self):
+        return sum(link.frames_lost for link in self.links)
+
+    @property
+    def bytes_sent(self):
+        return sum(link.bytes_sent for link in self.links)
+
+    def close(self):
+        super().close()
+        self._each(lambda link: link.write_hold(False))
+        self._each(lambda link: link.close())
+        self.pool.shutdown()
+
+    def _each(self, fn, items=None):
+        """Run fn on every link (or link, item pair) in parallel and wait"""
+        if items is None:
+            futures = [self.pool.submit(fn, link) for link in self.links]
+        else:
+            futures = [self.pool.submit(fn, link, item)
+                       for link, item in zip(self.links, items)]
+        return [f.result() for f in futures]
+
+    def write_brightness(self, val):
+        # The boards hold frames, so brightness only shows with a SHOW
+        def apply(link):
+            link.write_brightness(val)
+            link.write_show(self.frame_id)
+        self._each(apply)
+
+    def write_hold(self, hold):
+        # The links hold every frame anyway so they switch together, and
+        # each one is shown explicitly; there is nothing to change
+        pass
+
+    def write_show(self, frame_id):
+        self.frame_id = frame_id & 0xFF
+        self._each(lambda link: link.write_show(self.frame_id))
+
+    def write_frame(self, buf):
+        leds = np.frombuffer(buf, np.uint8).reshape(-1, 3)
+        tiles = [leds[gather].tobytes() for gather in self.gathers]
+        changed = self._each(lambda link, tile: link.write_frame(tile), tiles)
+        self.frame_id = (self.frame_id + 1) & 0xFF
+        self._each(lambda link, c: c and link.write_show(self.frame_id),
+                   changed)
+        if any(changed):
+            self.frames_sent += 1
+        else:
+            self.frames_unchanged += 1
+        return any(changed)
+# ===============================================================
+
+# ======================  LOOKUP TABLES  ======================
+# Built once at start-up and shared by every effect, so the per-frame work is
+# table lookups instead of sin/sqrt/HSV conversions per pixel.
+def _scale8(i, scale):
+    return (i * (scale + 1)) >> 8
+
+def _rainbow_entry(hue):
+    """FastLED's hsv2rgb_rainbow() at full saturation and value"""
+    offset8 = (hue & 0x1F) << 3
+    third = _scale8(offset8, 85)
+    twothirds = _scale8(offset8, 170)
+    section = hue >> 5
+    return ((255 - third, third, 0),                     # red → orange
+            (171, 85 + third, 0),                        # orange → yellow
+            (171 - twothirds, 170 + third, 0),           # yellow → green
+            (0, 255 - third, third),                     # green → aqua
+            (0, 171 - twothirds, 85 + twothirds),        # aqua → blue
+            (third, 0, 255 - third),                     # blue → purple
+            (85 + third, 0, 171 - third),                # purple → pink
+            (170 + third, 0, 85 - third))[section]       # pink → red
+
+def _heat_entry(temperature):
+    """FastLED's HeatColor(): black → red → yellow → white"""
+    t192 = (temperature * 191 >> 8) + (1 if temperature else 0)
+    ramp = (t192 & 0x3F) << 2
+    if t192 & 0x80:
+        return 255, 255, ramp
+    if t192 & 0x40:
+        return 255, ramp, 0
+    return ramp, 0, 0
+
+RAINBOW = np.array([_rainbow_entry(h) for h in range(256)], np.uint8)
+HEAT = np.array([_heat_entry(t) for t in range(256)], np.uint8)
+SINE = np.sin(np.arange(256) * (2 * math.pi / 256))   # one period, 256 steps
+_SINE_STEPS = 256 / (2 * math.pi)
+
+def sine(phase):
+    """np.sin() of an array of radians, from SINE"""
+    return SINE[(phase * _SINE_STEPS).astype(np.int64) & 0xFF]
+
+def hue8(hue):
+    """0-1 hue (wrapping) to a RAINBOW index"""
+    return (hue * 256).astype(np.int64) & 0xFF
+
+def paint(palette, index, out, value=255):
+    """out = palette[index], dimmed to value/255 like FastLED's scale8"""
+    if value >= 255:
+        np.take(palette, index, axis=0, out=out)
     else:
-        logical = y * COLS + x
-    return logical * 3
-
-def set_pixel(x, y, r, g, b):
-    if 0 <= x < COLS and 0 <= y < ROWS:
-        i = idx(x, y)
-        frame[i] = r & 0xFF
-        frame[i+1] = g & 0xFF
-        frame[i+2] = b & 0xFF
-
-def get_pixel(x, y):
-    i = idx(x, y)
-    return frame[i], frame[i+1], frame[i+2]
+        out[:] = palette[index].astype(np.uint16) * (int(value) + 1) >> 8
+    return out
+# ===============================================================
+
+# ======================  EFFECTS ENGINE  ======================
+# An effect renders with fn(grid, t, params, out): it fills `out`, a
+# (rows, cols, 3) uint8 array, with the picture at time `t`, working on whole
+# arrays. Effects that need nothing else join EFFECTS with @register_effect;
+# ones that carry state from frame to frame join SIMULATIONS with
+# @register_simulation.
+EffectParam = collections.namedtuple(
+    'EffectParam', 'name label low high default resolution')
+
+INTENSITY_PARAM = EffectParam('intensity', 'Intensity', 0, 255, 128, 1)
+SCALE_PARAM = EffectParam('scale', 'Scale', 0.1, 5, 1.0, 0.01)
+SPARKING_PARAM = EffectParam('sparking', 'Fire Sparking', 0, 1, 1.0, 0.01)
+COOLING_PARAM = EffectParam('cooling', 'Fire Cooling', 0, 20, 3, 1)
+
+class Effect:
+    """An entry of EFFECTS.
+
+    render must be pure: it draws from the grid, t and params alone, so
+    frames can be drawn in any order or cached. schema lists the params a
+    user can set. period is how far t moves before the picture repeats, if
+    it does; time_step is how far t moves per frame at speed 1, for effects
+    the GUI can play on their own. banded effects draw each row from its own
+    grid fields only, so bands of rows can be drawn side by side (see BAND
+    RENDERING).
+    """
+    def __init__(self, name, label, render, schema=(), period=None,
+                 time_step=None, banded=False):
+        self.name, self.label = name, label
+        self.render = render
+        self.schema = tuple(schema)
+        self.period = period
+        self.time_step = time_step
+        self.banded = banded
+
+    def params(self, values=None):
+        """Params for render() from raw values (slider positions): missing
+        ones take their default, and each is rounded to its resolution"""
+        values = values or {}
+        return {p.name: round(values.get(p.name, p.default) / p.resolution)
+                        * p.resolution for p in self.schema}
+
+EFFECTS = {}
+
+def register_effect(name, label, schema=(), period=None, time_step=None,
+                    banded=False):
+    """Decorator adding a render function to EFFECTS"""
+    def register(render):
+        EFFECTS[name] = Effect(name, label, render, schema, period, time_step,
+                               banded)
+        return render
+    return register
+
+class Simulation:
+    """An entry of SIMULATIONS: an effect whose next frame depends on the
+    last ones, so it cannot be cached or banded. make(rows, cols) builds its
+    state, whose step(params, out) draws the next frame into `out`.
+    """
+    def __init__(self, name, label, make, schema=()):
+        self.name, self.label = name, label
+        self.make = make
+        self.schema = tuple(schema)
+
+    params = Effect.params
+
+SIMULATIONS = {}
+
+def register_simulation(name, label, schema=()):
+    """Class decorator adding a stateful effect to SIMULATIONS"""
+    def register(make):
+        SIMULATIONS[name] = Simulation(name, label, make, schema)
+        return make
+    return register
+
+class EffectGrid:
+    """Coordinates and other static fields of a rows×cols matrix.
+
+    Everything here depends only on the size, so it is computed once and
+    shared; use effect_grid() to get the instance for a size.
+    """
+    def __init__(self, rows, cols):
+        self.rows, self.cols = rows, cols
+        self.y, self.x = np.mgrid[0:rows, 0:cols].astype(np.float64)
+        self.radius = np.hypot(self.x, self.y)             # from pixel (0, 0)
+        self.center_distance = np.hypot(self.x - cols / 2, self.y - rows / 2)
+        # x + y measured from each corner: top-left, top-right, bottom-left,
+        # bottom-right
+        y, x = np.mgrid[0:rows, 0:cols]
+        self.diagonals = (x + y, (cols - 1 - x) + y, x + (rows - 1 - y),
+                          (cols - 1 - x) + (rows - 1 - y))
+
+    def band(self, y0, y1):
+        """The grid of rows y0 to y1 only: every field is a view of those
+        rows, while rows and cols still give the size of the whole matrix"""
+        band = copy.copy(self)
+        for name in ('x', 'y', 'radius', 'center_distance'):
+            setattr(band, name, getattr(self, name)[y0:y1])
+        band.diagonals = tuple(d[y0:y1] for d in self.diagonals)
+        return band
+
+_grids = {}
+
+def effect_grid(rows, cols):
+    """The shared EffectGrid for a matrix size"""
+    if (rows, cols) not in _grids:
+        _grids[rows, cols] = EffectGrid(rows, cols)
+    return _grids[rows, cols]
+
+@register_effect('rainbow_wave', 'Rainbow Wave', (INTENSITY_PARAM,),
+                 period=4 * math.pi, time_step=0.1,   # sine((x + t) * 0.5)
+                 banded=True)
+def effect_rainbow_wave(grid, t, params, out):
+    wave = sine((grid.x + t) * 0.5) * 0.5 + 0.5
+    return paint(RAINBOW, hue8(wave + grid.y * 0.1), out, params['intensity'])
+
+@register_effect('plasma', 'Plasma', (SCALE_PARAM, INTENSITY_PARAM),
+                 period=2 * math.pi, time_step=0.01, banded=True)
+def effect_plasma(grid, t, params, out):
+    k = params['scale'] * 0.1
+    x, y = grid.x, grid.y
+    plasma = (sine(x * k + t) + sine(y * k + t) + sine((x + y) * k + t)
+              + sine(grid.radius * k + t)) / 4
+    return paint(RAINBOW, hue8((plasma + 1) / 2), out, params['intensity'])
+
+@register_effect('color_morph', 'Color Morph', (INTENSITY_PARAM,),
+                 period=1.0, time_step=0.01,          # hue wraps every 1.0
+                 banded=True)
+def effect_color_morph(grid, t, params, out):
+    return paint(RAINBOW, hue8(grid.center_distance * 0.1 + t), out,
+                 params['intensity'])
+
+@register_effect('corner_rainbow', 'Corner Rainbow', banded=True)
+def effect_corner_rainbow(grid, t, params, out):
+    """Diagonal rainbow from corner params['corner'] (0 top-left, 1 top-right,
+    2 bottom-left, 3 bottom-right) at params['brightness'] (0-1). Both are
+    driven by the GUI's corner switching rather than set by the user."""
+    hue = (grid.diagonals[params['corner']] * 12 + int(t)) & 0xFF
+    return paint(RAINBOW, hue, out, params['brightness'] * 255)
+
+@register_simulation('fire', 'Fire',
+                     (INTENSITY_PARAM, SPARKING_PARAM, COOLING_PARAM))
+class Fire:
+    """Heat rising from a fuel row under the matrix, spreading sideways and
+    cooling as it goes, in the spirit of FastLED's Fire2012.
+
+    step() params: intensity - hottest spark (0-255), sparking - share of the
+    fuel row that flares each frame (0-1; the rest dies down by half),
+    cooling - most heat a cell can lose per frame.
+    """
+    def __init__(self, rows, cols, rng=None):
+        self.rows, self.cols = rows, cols
+        self.heat = np.zeros((rows + 1, cols), np.int32)    # last row is fuel
+        self.rng = rng or np.random.default_rng()
+        self.padded = np.zeros((rows + 1, cols + 2), np.int32)
+        # Each cell averages itself, its left and right neighbours and the
+        # same three cells in the row below: six cells, four at the edges
+        self.counts = np.full(cols, 6, np.int32)
+        self.counts[0] -= 2
+        self.counts[-1] -= 2
+
+    def step(self, params, out):
+        heat, rng, rows, cols = self.heat, self.rng, self.rows, self.cols
+        flare = rng.random(cols) < params['sparking']
+        sparks = rng.integers(0, int(params['intensity']) + 1, cols)
+        heat[rows] = np.where(flare, sparks, heat[rows] // 2)
+
+        padded = self.padded
+        padded[:, 1:-1] = heat
+        across = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+        heat[:rows] = (across[:-1] + across[1:]) // self.counts
+        heat[:rows] -= rng.integers(0, int(params['cooling']) + 1, (rows, cols))
+        np.clip(heat, 0, 255, out=heat)
+        return paint(HEAT, heat[:rows], out)
+
+class Particles:
+    """A growable pool of particles kept as parallel arrays.
+
+    pos and vel are (n, 2) float arrays of (y, x) in pixels, color is (n, 3)
+    and life the number of frames left; slots with life <= 0 are free.
+    """
+    def __init__(self, rows, cols, capacity=64, rng=None):
+        self.rows, self.cols = rows, cols
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.color = np.zeros((capacity, 3))
+        self.life = np.zeros(capacity)
+        self.rng = rng or np.random.default_rng()
+        self.glow = np.zeros((rows, cols, 3))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.life > 0))
+
+    def spawn(self, n, pos, vel=0, color=255, life=1):
+        """Start n particles; each argument broadcasts to n rows"""
+        free = np.flatnonzero(self.life <= 0)
+        if len(free) < n:
+            self._grow(len(self.life) + n - len(free))
+            free = np.flatnonzero(self.life <= 0)
+        slots = free[:n]
+        self.pos[slots] = pos
+        self.vel[slots] = vel
+        self.color[slots] = color
+        self.life[slots] = life
+        return slots
+
+    def _grow(self, size):
+        size = max(size, 2 * len(self.life))
+        for name in ('pos', 'vel', 'color', 'life'):
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:])
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def step(self):
+        """Move every particle one frame and age it"""
+        self.pos += self.vel
+        self.life -= 1
+
+    def render(self, out, fade=1.0, stamp=((0, 0, 1.0),)):
+        """Fade `out`, then draw the live particles over it.
+
+        stamp lists the (dy, dx, weight) pixels drawn for each particle.
+        Particles landing on the same pixel add up, and the sum replaces the
+        faded pixel where it is brighter.
+        """
+        if fade != 1.0:
+            out[:] = out * fade
+        live = np.flatnonzero(self.life > 0)
+        if not len(live):
+            return out
+        glow = self.glow
+        glow.fill(0)
+        base = np.floor(self.pos[live]).astype(np.int64)
+        color = self.color[live]
+        for dy, dx, weight in stamp:
+            y, x = base[:, 0] + dy, base[:, 1] + dx
+            inside = (y >= 0) & (y < self.rows) & (x >= 0) & (x < self.cols)
+            np.add.at(glow, (y[inside], x[inside]), color[inside] * weight)
+        np.maximum(out, np.minimum(glow, 255).astype(np.uint8), out=out)
+        return out
+
+RAIN_TRAIL = ((0, 0, 1.0), (-1, 0, 0.7), (-2, 0, 0.4))
+
+@register_simulation('matrix_rain', 'Matrix Rain')
+class MatrixRain:
+    """Green drops falling through Particles, one per two columns"""
+    def __init__(self, rows, cols):
+        self.drops = Particles(rows, cols)
+
+    def step(self, params, out):
+        drops = self.drops
+        rows, cols, rng = drops.rows, drops.cols, drops.rng
+        drops.step()
+        drops.life[drops.pos[:, 0] > rows + 3] = 0
+        n = cols // 2 - len(drops)
+        if n > 0:
+            pos = np.column_stack((rng.integers(-rows, 0, n, endpoint=True),
+                                   rng.integers(0, cols, n)))
+            vel = np.column_stack((rng.uniform(0.5, 2.0, n), np.zeros(n)))
+            color = np.zeros((n, 3))
+            color[:, 1] = rng.integers(64, 256, n)
+            drops.spawn(n, pos, vel, color, np.inf)
+        return drops.render(out, 0.9, RAIN_TRAIL)
+
+@register_simulation('sparkles', 'Sparkles', (INTENSITY_PARAM,))
+class Sparkles:
+    """Fresh single-frame sparks over a fading picture. The number of sparks
+    scales with the intensity and the matrix area."""
+    def __init__(self, rows, cols):
+        self.sparks = Particles(rows, cols)
+
+    def step(self, params, out):
+        sparks = self.sparks
+        rows, cols, rng = sparks.rows, sparks.cols, sparks.rng
+        sparks.step()
+        n = max(1, int(params['intensity'] / 32 * rows * cols / (ROWS * COLS)))
+        pos = np.column_stack((rng.integers(0, rows, n),
+                               rng.integers(0, cols, n)))
+        sparks.spawn(n, pos, 0, RAINBOW[rng.integers(0, 256, n)], 1)
+        return sparks.render(out, 0.95)
+# ===============================================================
+
+# ======================  EFFECT CACHE  ======================
+class EffectCache:
+    """Replays effects with a period instead of rendering them again.
+
+    A loop is one period cut into the frames the animation steps through.
+    Each frame is rendered the first time it is needed and kept as it was
+    drawn; after that it is copied back with one contiguous copy, leaving
+    to_wire() as the only reordering. Loops are keyed by effect, matrix
+    size, parameters and frame count, and the least recently used are
+    dropped to stay under `budget` bytes.
+    """
+    def __init__(self, budget=EFFECT_CACHE_MB << 20):
+        self.budget = budget
+        self.used = 0
+        self.loops = collections.OrderedDict()
+
+    def render(self, name, grid, t, params, step, out):
+        """Draw effect `name` at time t into out; step is how far t moves per
+        frame. Returns None, drawing nothing, if the effect cannot be cached."""
+        loop = self.loop(name, grid, params, step)
+        if loop is None:
+            return None
+        frames, ready = loop
+        count = len(ready)
+        render, period = EFFECTS[name].render, EFFECTS[name].period
+        i = int(round(t * count / period)) % count
+        if ready[i]:
+            out[:] = frames[i]
+        else:
+            render(grid, i * period / count, params, out)
+            frames[i] = out
+            ready[i] = True
+        return out
+
+    def loop(self, name, grid, params, step):
+        """(frames, ready) for a loop, or None if it cannot be cached"""
+        period = EFFECTS[name].period
+        if period is None or step <= 0:
+            return None
+        count = max(1, int(round(period / step)))
+        key = (name, grid.rows, grid.cols, tuple(sorted(params.items())), count)
+        loop = self.loops.get(key)
+        if loop is not None:
+            self.loops.move_to_end(key)
+            return loop
+        size = count * grid.rows * grid.cols * 3
+        if size > self.budget:
+            return None
+        while self.used + size > self.budget:
+            _, (frames, _) = self.loops.popitem(last=False)
+            self.used -= frames.nbytes
+        loop = (np.empty((count, grid.rows, grid.cols, 3), np.uint8),
+                np.zeros(count, bool))
+        self.loops[key] = loop
+        self.used += size
+        return loop
+# ===============================================================
+
+# ======================  BAND RENDERING  ======================
+class BandRenderer:
+    """Draws banded effects on large frames one band of rows per thread.
+
+    Each thread renders into a view of its rows of `out`, so the bands need
+    no joining, and NumPy releases the GIL for the array work inside them.
+    Small frames, effects that are not banded and single-core machines are
+    drawn in one piece.
+    """
+    def __init__(self, grid, threads=RENDER_THREADS, min_leds=BAND_MIN_LEDS):
+        threads = min(threads or os.cpu_count() or 1, grid.rows)
+        self.grid = grid
+        self.pool = None
+        self.bands = []
+        if threads > 1 and grid.rows * grid.cols >= min_leds:
+            edges = np.linspace(0, grid.rows, threads + 1).astype(int)
+            self.bands = [(grid.band(y0, y1), slice(y0, y1))
+                          for y0, y1 in zip(edges[:-1], edges[1:])]
+            self.pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix='BandRenderer')
+
+    def render(self, effect, t, params, out):
+        if self.pool is None or not effect.banded:
+            return effect.render(self.grid, t, params, out)
+        futures = [self.pool.submit(effect.render, band, t, params, out[rows])
+                   for band, rows in self.bands]
+        for future in futures:
+            future.result()
+        return out
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+# ===============================================================
+
+# ======================  DRAWING HELPERS  ======================
+def line_points(x0, y0, x1, y1):
+    """Pixels of a Bresenham line from (x0, y0) to (x1, y1), both included"""
+    dx = abs(x1 - x0)
+    sx = 1 if x0 < x1 else -1
+    dy = -abs(y1 - y0)
+    sy = 1 if y0 < y1 else -1
+    err = dx + dy
+    
+    while True:
+        yield x0, y0
+        if x0 == x1 and y0 == y1:
+            break
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+# ===============================================================
+
+# ======================  PARAMETER STORE  ======================
+class ParamStore:
+    """Plain Python copies of Tk variables, kept current by write traces.
+
+    Reading a Tk variable is a round trip through the Tcl interpreter and
+    only works on the Tk thread. Values read from the store cost a dict
+    lookup, and snapshot() hands out a read-only copy that stays the same
+    for a whole frame and can be passed to other threads.
+    """
+    def __init__(self):
+        self.vars = {}
+        self.values = {}
+        self._snapshot = None
+
+    def track(self, name, var):
+        self.vars[name] = var
+        self.values[name] = var.get()
+        var.trace_add('write', lambda *args: self.changed(name))
+        self._snapshot = None
+        return var
+
+    def changed(self, name):
+        try:
+            self.values[name] = self.vars[name].get()
+        except tk.TclError:      # half-typed value in a spinbox: keep the last
+            return
+        self._snapshot = None
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def snapshot(self):
+        """Read-only mapping of every value as it is now"""
+        if self._snapshot is None:
+            self._snapshot = types.MappingProxyType(dict(self.values))
+        return self._snapshot
+# ===============================================================
+
+# ======================  FRAME CLOCK  ======================
+class FrameClock:
+    """Runs one animation producer at a time on Tk's event loop.
+
+    start(step) replaces whatever was running. step() is called at once and
+    then again each time the delay it returns (in ms) has passed, until it
+    returns None. Delays count from the previous deadline, not from when
+    the step finished, so time spent rendering does not slow the animation.
+    A step that runs more than a frame late either drops the missed ticks
+    (skip=True) or runs them back to back, at most MAX_CATCH_UP of them.
+    """
+    MAX_CATCH_UP = 5
+
+    def __init__(self, root, skip=True):
+        self.root = root
+        self.skip = skip
+        self.step = None
+        self.job = None
+        self.deadline = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.fps = 0.0          # smoothed ticks per second
+        self.jitter = 0.0       # smoothed distance of a tick from its deadline, ms
+        self.skipped = 0
+        self.last_tick = None
+
+    @property
+    def running(self):
+        return self.step is not None
+
+    def start(self, step):
+        self.stop()
+        self.reset_stats()
+        self.step = step
+        self.deadline = time.monotonic()
+        self.job = self.root.after_idle(self.tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.step = None
+
+    def tick(self):
+        self.job = None
+        step = self.step
+        self.measure(time.monotonic())
+        delay = step()
+        if self.step is not step:           # stopped or replaced by step()
+            return
+        if delay is None:
+            self.step = None
+            return
+        interval = max(delay, 1) / 1000
+        self.deadline += interval
+        now = time.monotonic()
+        late = int((now - self.deadline) / interval)
+        if late > 0:
+            if self.skip:
+                self.skipped += late
+                self.deadline += late * interval
+            else:
+                self.deadline = max(self.deadline,
+                                    now - self.MAX_CATCH_UP * interval)
+        wait = max(self.deadline - now, 0)
+        self.job = self.root.after(int(round(wait * 1000)), self.tick)
+
+    def measure(self, now):
+        if self.last_tick is not None and now > self.last_tick:
+            fps = 1 / (now - self.last_tick)
+            self.fps = fps if not self.fps else self.fps * 0.9 + fps * 0.1
+        self.jitter = self.jitter * 0.9 + abs(now - self.deadline) * 100
+        self.last_tick = now
 # ===============================================================
 
 # ======================  MAIN APPLICATION CLASS  =============
 class MatrixPainter:
-    def __init__(self):
+    def __init__(self, rows=ROWS, cols=COLS, scale=None, wiring=WIRING):
+        self.rows, self.cols = rows, cols
+        self.scale = scale or fit_scale(rows, cols)
         self.root = tk.Tk()
-        self.root.title('Matrix Painter – 9×22 WS2812B')
+        self.root.title(f'Matrix Painter – {rows}×{cols} WS2812B')
         self.root.resizable(False, False)
         
         # Application state
+        self.frame = FrameBuffer(rows, cols, compile_wiring(rows, cols, wiring))
+        self.effect_grid = effect_grid(rows, cols)
+        self.effect_cache = EffectCache()
+        self.band_renderer = BandRenderer(self.effect_grid)
         self.serial_link = None
+        self.stats_job = None
+        self.connecting = False
+        self.port_info = {}            # device -> description from scan_ports()
+        self.worker = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='MatrixPainter')
         self.animation_running = False
         self.recording = False
         self.animation_frames = []
         self.current_tool = 'brush'
         self.current_color = (255, 255, 255)
         self.show_on_screen = tk.BooleanVar(value=True)
+        self.preview_mode = tk.StringVar(value=PREVIEW)
+        self.live_stroke = tk.BooleanVar(value=True)
+        self.render_fps = tk.IntVar(value=RENDER_FPS)
+        self.preview_fps = tk.IntVar(value=PREVIEW_FPS)
+        self.output_fps = tk.IntVar(value=OUTPUT_FPS)
+        self.throttled = {}            # name -> [last run, pending after() id]
+        self.clock = FrameClock(self.root)
+        self.skip_frames = tk.BooleanVar(value=self.clock.skip)
         
         # Advanced brush settings
         self.brush_size = tk.IntVar(value=1)
@@ -92,12 +1688,21 @@ class MatrixPainter:
         self.direction_y = tk.DoubleVar(value=0.0)
         
         # Animation state
-        self.captured_drawing = None  # Store user's drawing
+        self.captured_drawing = None  # copy of the frame holding the user's drawing
         self.animation_offset_x = 0.0
         self.animation_offset_y = 0.0
         self.animation_time = 0
         self.keep_alive = False
         
+        # Values read while animating; effect settings join in setup_effects_tab
+        self.params = ParamStore()
+        for name in ('show_on_screen', 'preview_mode', 'live_stroke',
+                     'render_fps', 'preview_fps', 'output_fps',
+                     'brush_size', 'brush_opacity', 'color_variance',
+                     'auto_color_cycle', 'color_cycle_speed',
+                     'anim_speed', 'direction_x', 'direction_y'):
+            self.params.track(name, getattr(self, name))
+        
         self.setup_ui()
         self.init_canvas()
         
@@ -123,25 +1728,47 @@ class MatrixPainter:
         ttk.Label(conn_frame, text="Port:").grid(row=0, column=0, padx=5)
         self.port_var = tk.StringVar()
         self.port_combo = ttk.Combobox(conn_frame, textvariable=self.port_var,
-                                      width=12, state='readonly')
+                                      width=16)
         self.port_combo.grid(row=0, column=1, padx=5)
         
         ttk.Button(conn_frame, text='Refresh', 
                   command=self.refresh_ports).grid(row=0, column=2, padx=5)
         ttk.Button(conn_frame, text='Connect', 
                   command=self.connect).grid(row=0, column=3, padx=5)
+        ttk.Button(conn_frame, text='Load Layout', 
+                  command=self.connect_layout).grid(row=0, column=4, padx=5)
         
         # Status
         self.status_lbl = ttk.Label(conn_frame, text='Not connected')
-        self.status_lbl.grid(row=0, column=4, padx=20)
+        self.status_lbl.grid(row=0, column=5, padx=20)
         
         # Brightness
-        ttk.Label(conn_frame, text="Brightness:").grid(row=0, column=5, padx=(20,5))
+        ttk.Label(conn_frame, text="Brightness:").grid(row=0, column=6, padx=(20,5))
         self.bright_slider = ttk.Scale(conn_frame, from_=0, to=255, 
                                       orient='horizontal', length=150,
                                       command=self.brightness_changed)
         self.bright_slider.set(DEFAULT_BRIGHT)
-        self.bright_slider.grid(row=0, column=6, padx=5)
+        self.bright_slider.grid(row=0, column=7, padx=5)
+        
+        # Link statistics
+        self.link_stats_lbl = ttk.Label(conn_frame, text='')
+        self.link_stats_lbl.grid(row=1, column=0, columnspan=8, sticky='w', padx=5)
+        
+        # Frame rates: rendering, canvas preview and LEDs run independently
+        rates_frame = ttk.Frame(conn_frame)
+        rates_frame.grid(row=2, column=0, columnspan=8, sticky='w', pady=(5, 0))
+        for col, (text, var) in enumerate((('Render fps:', self.render_fps),
+                                           ('Preview fps:', self.preview_fps),
+                                           ('LED fps:', self.output_fps))):
+            ttk.Label(rates_frame, text=text).grid(row=0, column=col * 2, padx=5)
+            ttk.Spinbox(rates_frame, from_=1, to=240, width=5,
+                        textvariable=var).grid(row=0, column=col * 2 + 1)
+        ttk.Checkbutton(rates_frame, text='Skip Late Frames',
+                        variable=self.skip_frames,
+                        command=self.skip_frames_changed).grid(row=0, column=6, padx=5)
+        self.clock_stats_lbl = ttk.Label(rates_frame, text='')
+        self.clock_stats_lbl.grid(row=0, column=7, padx=5)
+        self.update_clock_stats()
         
         self.refresh_ports()
         
@@ -150,8 +1777,8 @@ class MatrixPainter:
         canvas_frame.pack(pady=10)
         
         self.canvas = tk.Canvas(canvas_frame,
-                              width=COLS * SCALE,
-                              height=ROWS * SCALE,
+                              width=self.cols * self.scale,
+                              height=self.rows * self.scale,
                               bg='black',
                               highlightthickness=1,
                               highlightbackground='gray')
@@ -164,9 +1791,15 @@ class MatrixPainter:
         self.canvas.bind('<Motion>', self.on_mouse_hover)
         
         # Canvas state
-        self.cell_id = [[None for _ in range(COLS)] for _ in range(ROWS)]
+        self.cell_id = [[None for _ in range(self.cols)] for _ in range(self.rows)]
         self.start_pt = None
+        self.last_pt = None            # previous drag sample
         self.preview_ids = []
+        # 'image' preview: the whole frame as one bitmap under everything else
+        self.preview_photo = ImageTk.PhotoImage(
+            'RGB', (self.cols * self.scale, self.rows * self.scale))
+        self.preview_item = self.canvas.create_image(
+            0, 0, anchor='nw', image=self.preview_photo)
         
     def setup_control_tabs(self, parent):
         # Create notebook for tabbed interface
@@ -247,6 +1880,14 @@ class MatrixPainter:
                   command=self.undo_last).grid(row=0, column=1, padx=5)
         ttk.Checkbutton(actions_frame, text="Show on Screen", 
                        variable=self.show_on_screen).grid(row=0, column=2, padx=5)
+        ttk.Checkbutton(actions_frame, text="Live Stroke", 
+                       variable=self.live_stroke).grid(row=0, column=3, padx=5)
+        ttk.Label(actions_frame, text="Preview:").grid(row=0, column=4, padx=(15, 5))
+        preview_combo = ttk.Combobox(actions_frame, textvariable=self.preview_mode,
+                                     values=('image', 'cells'), width=7,
+                                     state='readonly')
+        preview_combo.grid(row=0, column=5)
+        preview_combo.bind('<<ComboboxSelected>>', self.preview_mode_changed)
         
         draw_frame.columnconfigure(0, weight=1)
         draw_frame.columnconfigure(1, weight=1)
@@ -326,15 +1967,13 @@ class MatrixPainter:
         realtime_frame = ttk.LabelFrame(effects_frame, text="Real-time Effects", padding=10)
         realtime_frame.grid(row=0, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
         
-        effects = [
-            ("Rainbow Wave", self.effect_rainbow_wave),
-            ("Plasma", self.effect_plasma),
-            ("Fire", self.effect_fire),
-            ("Matrix Rain", self.effect_matrix_rain),
-            ("Sparkles", self.effect_sparkles),
-            ("Color Morph", self.effect_color_morph),
-            ("Corner Rainbow", self.effect_corner_rainbow)
-        ]
+        # Registered effects that play on their own, the simulations, and
+        # Corner Rainbow, whose corner switching is driven from here
+        effects = [(effect.label, lambda name=name: self.start_effect(name))
+                   for name, effect in EFFECTS.items() if effect.time_step]
+        effects += [(sim.label, lambda name=name: self.start_simulation(name))
+                    for name, sim in SIMULATIONS.items()]
+        effects.append(("Corner Rainbow", self.effect_corner_rainbow))
         
         for i, (name, func) in enumerate(effects):
             row, col = divmod(i, 3)
@@ -349,21 +1988,30 @@ class MatrixPainter:
         params_frame = ttk.LabelFrame(effects_frame, text="Effect Parameters", padding=10)
         params_frame.grid(row=1, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
         
-        self.effect_speed = tk.DoubleVar(value=5.0)
-        self.effect_intensity = tk.DoubleVar(value=128.0)
-        self.effect_scale = tk.DoubleVar(value=1.0)
+        self.effect_speed = self.params.track('effect_speed', tk.DoubleVar(value=5.0))
         
         ttk.Label(params_frame, text="Speed:").grid(row=0, column=0, sticky='w')
         ttk.Scale(params_frame, from_=0.1, to=20, orient='horizontal', 
                  variable=self.effect_speed).grid(row=0, column=1, sticky='ew')
         
-        ttk.Label(params_frame, text="Intensity:").grid(row=1, column=0, sticky='w')
-        ttk.Scale(params_frame, from_=0, to=255, orient='horizontal', 
-                 variable=self.effect_intensity).grid(row=1, column=1, sticky='ew')
-        
-        ttk.Label(params_frame, text="Scale:").grid(row=2, column=0, sticky='w')
-        ttk.Scale(params_frame, from_=0.1, to=5, orient='horizontal', 
-                 variable=self.effect_scale).grid(row=2, column=1, sticky='ew')
+        # One slider per parameter named in the registered effects' and
+        # simulations' schemas; those sharing a parameter name share its slider
+        self.effect_vars = {}
+        for effect in [*EFFECTS.values(), *SIMULATIONS.values()]:
+            for param in effect.schema:
+                if param.name in self.effect_vars:
+                    continue
+                row = len(self.effect_vars) + 1
+                var = self.effect_vars[param.name] = self.params.track(
+                    param.name, tk.DoubleVar(value=param.default))
+                ttk.Label(params_frame, text=param.label + ":").grid(row=row, column=0, sticky='w')
+                ttk.Scale(params_frame, from_=param.low, to=param.high, orient='horizontal', 
+                         variable=var).grid(row=row, column=1, sticky='ew')
+        
+        row = len(self.effect_vars) + 1
+        self.bake_effects = self.params.track('bake_effects', tk.BooleanVar(value=True))
+        ttk.Checkbutton(params_frame, text="Replay Baked Loops",
+                        variable=self.bake_effects).grid(row=row, column=0, columnspan=2, sticky='w')
         
         params_frame.columnconfigure(1, weight=1)
         effects_frame.columnconfigure(0, weight=1)
@@ -398,22 +2046,123 @@ class MatrixPainter:
         file_frame.columnconfigure(0, weight=1)
         
     # ====================== CONNECTION METHODS ======================
+    def run_in_background(self, fn, done, *args):
+        """Run fn(*args) on a worker thread, then done(future) on the Tk thread"""
+        future = self.worker.submit(fn, *args)
+        def poll():
+            if future.done():
+                done(future)
+            else:
+                self.root.after(50, poll)
+        poll()
+
     def refresh_ports(self):
-        ports = [p.device for p in serial.tools.list_ports.comports()]
-        self.port_combo['values'] = ports
+        self.run_in_background(scan_ports, self.ports_scanned)
+
+    def ports_scanned(self, future):
+        try:
+            ports = future.result()
+        except Exception as e:
+            self.status_lbl.config(text=f'Port scan failed: {e}')
+            return
+        self.port_info = dict(ports)
+        self.port_combo['values'] = [device for device, _ in ports]
         if ports:
             self.port_combo.current(0)
-            
+        if not self.serial_link and not self.connecting:
+            first = ports[0][1] if ports else ''
+            self.status_lbl.config(
+                text=f'{len(ports)} ports found' + (f' – {first}' if first else ''))
+
     def connect(self):
         port = self.port_var.get()
         if not port:
             messagebox.showerror('Error', 'Select a port first')
             return
+        self.open_link(port, 'Serial error', open_transport, port)
+
+    def connect_layout(self):
+        """Drive several controllers described by a layout file"""
+        filename = filedialog.askopenfilename(
+            filetypes=[('Layout files', '*.json')])
+        if not filename:
+            return
+        try:
+            segments = load_layout(filename)
+        except Exception as e:
+            messagebox.showerror('Layout error', str(e))
+            return
+        self.open_link(f'{len(segments)} controllers', 'Layout error',
+                       ShardedOutput, segments, self.frame.wire_map)
+
+    def open_link(self, name, error_title, opener, *args):
+        """Open a transport on a worker thread so the GUI keeps running
+        while the boards reset and negotiate"""
+        if self.connecting:
+            return
+        if self.serial_link:
+            self.serial_link.close()
+            self.serial_link = None
+        self.connecting = True
+        self.status_lbl.config(text=f'Connecting to {name}…')
+        self.run_in_background(
+            opener, lambda f: self.link_opened(f, name, error_title), *args)
+
+    def link_opened(self, future, name, error_title):
+        self.connecting = False
         try:
-            self.serial_link = SerialLink(port)
-            self.status_lbl.config(text=f'Connected to {port}')
+            link = future.result()
         except Exception as e:
-            messagebox.showerror('Serial error', str(e))
+            self.status_lbl.config(text='Not connected')
+            messagebox.showerror(error_title, str(e))
+            return
+        self.serial_link = link
+        text = f'Connected to {name}'
+        baud = getattr(link, 'baud', None)
+        if baud:
+            text += f' @ {baud} baud'
+        if link.rows is not None and (link.rows, link.cols) != (self.rows, self.cols):
+            text += f' – board is {link.rows}×{link.cols}, canvas {self.rows}×{self.cols}'
+        self.status_lbl.config(text=text)
+        self.update_link_stats()
+            
+    def skip_frames_changed(self):
+        self.clock.skip = self.skip_frames.get()
+
+    def update_clock_stats(self):
+        """Show the animation clock's measured rate, refreshed once a second"""
+        clock = self.clock
+        if clock.running:
+            self.clock_stats_lbl.config(
+                text=f'Animation: {clock.fps:.1f} fps, '
+                     f'{clock.jitter:.1f} ms jitter, {clock.skipped} skipped')
+        else:
+            self.clock_stats_lbl.config(text='')
+        self.root.after(1000, self.update_clock_stats)
+
+    def update_link_stats(self):
+        """Show the sender thread's counters, refreshed once a second"""
+        link = self.serial_link
+        if link and link.error:
+            self.serial_link = None
+            try:
+                link.close()
+            except Exception:
+                pass     # the link is broken already
+            self.status_lbl.config(text=f'Connection lost: {link.error}')
+            link = None
+        if not link:
+            self.link_stats_lbl.config(text='')
+            return
+        self.link_stats_lbl.config(
+            text=f'TX: {link.frames_per_second:.1f} fps, '
+                 f'{link.bytes_per_second / 1024:.1f} kB/s, '
+                 f'{link.frames_sent} sent, {link.frames_unchanged} unchanged, '
+                 f'{link.frames_dropped} dropped, '
+                 f'{link.frames_lost} lost')
+        if self.stats_job:
+            self.root.after_cancel(self.stats_job)
+        self.stats_job = self.root.after(1000, self.update_link_stats)
             
     def brightness_changed(self, value):
         if self.serial_link:
@@ -427,37 +2176,95 @@ class MatrixPainter:
         return '#%02x%02x%02x' % rgb
         
     def draw_square(self, x, y, color, update_canvas=True):
-        if not (0 <= x < COLS and 0 <= y < ROWS):
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
             return
             
-        set_pixel(x, y, *color)
+        self.frame.set(x, y, color)
         
-        if not update_canvas:
-            return
-            
-        hexcol = self.rgb_to_hex(color)
-        if self.cell_id[y][x] is None:
-            x0, y0 = x * SCALE, y * SCALE
-            rect = self.canvas.create_rectangle(
-                x0, y0, x0 + SCALE, y0 + SCALE,
-                fill=hexcol, outline='')
-            self.cell_id[y][x] = rect
-        else:
-            self.canvas.itemconfig(self.cell_id[y][x], fill=hexcol)
+        if update_canvas:
+            self.request_preview()
             
     def update_canvas(self):
-        for y in range(ROWS):
-            for x in range(COLS):
-                r, g, b = get_pixel(x, y)
-                self.draw_square(x, y, (r, g, b), True)
+        """Bring the canvas up to date with the frame"""
+        self.request_preview()
+
+    def throttle(self, name, rate, fn):
+        """Run fn at most `rate` (a frame-rate param) times a second.
+
+        Calls that come too early collapse into one run at the next free
+        slot, so fn always sees the latest state. A run that is due happens
+        once the current event has been handled, not inside it.
+        """
+        state = self.throttled.setdefault(name, [0.0, None])
+        if state[1] is not None:
+            return
+        def run():
+            state[0], state[1] = time.monotonic(), None
+            fn()
+        wait = state[0] + 1.0 / self.get_rate(rate) - time.monotonic()
+        if wait > 0:
+            state[1] = self.root.after(int(wait * 1000) + 1, run)
+        else:
+            state[1] = self.root.after_idle(run)
+
+    def get_rate(self, rate):
+        return min(max(self.params[rate], 1), 1000)
+
+    def step_delay(self, delay):
+        """Delay in ms before the next animation step, capped by Render fps"""
+        return max(delay, int(1000 / self.get_rate('render_fps')))
+
+    def request_preview(self):
+        """Update the canvas at the next preview slot, however many pixels
+        changed until then"""
+        self.throttle('preview', 'preview_fps', self.render_preview)
+
+    def render_preview(self):
+        """Repaint the pixels whose colour changed since the last repaint"""
+        ys, xs = self.frame.take_dirty()
+        if not len(ys):
+            return
+        if self.params['preview_mode'] == 'image':
+            self.preview_photo.paste(scaled_image(self.frame.pixels, self.scale))
+            return
+        pixels = self.frame.pixels
+        for y, x in zip(ys.tolist(), xs.tolist()):
+            hexcol = '#%02x%02x%02x' % tuple(pixels[y, x].tolist())
+            if self.cell_id[y][x] is None:
+                x0, y0 = x * self.scale, y * self.scale
+                self.cell_id[y][x] = self.canvas.create_rectangle(
+                    x0, y0, x0 + self.scale, y0 + self.scale,
+                    fill=hexcol, outline='')
+            else:
+                self.canvas.itemconfig(self.cell_id[y][x], fill=hexcol)
+
+    def preview_mode_changed(self, event=None):
+        for row in self.cell_id:
+            for rect in row:
+                if rect is not None:
+                    self.canvas.delete(rect)
+        self.cell_id = [[None] * self.cols for _ in range(self.rows)]
+        image = self.params['preview_mode'] == 'image'
+        self.canvas.itemconfig(self.preview_item,
+                               state='normal' if image else 'hidden')
+        if image:
+            self.frame.mark_dirty()
+        else:
+            self.frame.mark_dirty(blank=True)   # black cells need no rectangle
+        self.update_canvas()
                 
     def send_to_matrix(self):
+        """Send the frame at the next LED slot; frames in between are skipped"""
+        if self.serial_link:
+            self.throttle('output', 'output_fps', self.write_output)
+
+    def write_output(self):
         if self.serial_link:
-            self.serial_link.send_full_frame(frame)
+            self.serial_link.send_frame(self.frame.to_wire())
 
     def record_frame(self):
         if self.recording:
-            self.animation_frames.append(frame[:])
+            self.animation_frames.append(self.frame.to_wire())
             
     # ====================== DRAWING METHODS ======================
     def choose_color(self):
@@ -467,18 +2274,18 @@ class MatrixPainter:
             self.color_btn.config(bg=self.rgb_to_hex(self.current_color))
             
     def get_current_color(self):
-        if self.auto_color_cycle.get():
+        if self.params['auto_color_cycle']:
             # Cycle through hue spectrum
             hue = (self.color_hue_offset % 360) / 360
-            self.color_hue_offset += self.color_cycle_speed.get()
+            self.color_hue_offset += self.params['color_cycle_speed']
             r, g, b = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
             color = (int(r * 255), int(g * 255), int(b * 255))
         else:
             color = self.current_color
             
         # Apply color variance
-        if self.color_variance.get() > 0:
-            variance = self.color_variance.get()
+        if self.params['color_variance'] > 0:
+            variance = self.params['color_variance']
             r, g, b = color
             r = max(0, min(255, r + random.randint(-int(variance), int(variance))))
             g = max(0, min(255, g + random.randint(-int(variance), int(variance))))
@@ -487,49 +2294,69 @@ class MatrixPainter:
             
         return color
         
-    def apply_brush(self, x, y):
-        size = self.brush_size.get()
-        opacity = self.brush_opacity.get()
-        color = self.get_current_color()
+    def apply_brush(self, x, y, color=None):
+        size = self.params['brush_size']
+        opacity = self.params['brush_opacity']
+        if color is None:
+            color = self.get_current_color()
         
         # Apply brush with size and opacity
         for dy in range(-size//2, size//2 + 1):
             for dx in range(-size//2, size//2 + 1):
                 if dx*dx + dy*dy <= (size//2)**2:  # Circular brush
                     px, py = x + dx, y + dy
-                    if 0 <= px < COLS and 0 <= py < ROWS:
+                    if 0 <= px < self.cols and 0 <= py < self.rows:
                         if opacity < 1.0:
                             # Blend with existing pixel
-                            old_r, old_g, old_b = get_pixel(px, py)
+                            old_r, old_g, old_b = self.frame.get(px, py)
                             new_r = int(old_r * (1-opacity) + color[0] * opacity)
                             new_g = int(old_g * (1-opacity) + color[1] * opacity)
                             new_b = int(old_b * (1-opacity) + color[2] * opacity)
                             final_color = (new_r, new_g, new_b)
                         else:
                             final_color = color
-                        self.draw_square(px, py, final_color, self.show_on_screen.get())
+                        self.draw_square(px, py, final_color, self.params['show_on_screen'])
                         
     # ====================== MOUSE HANDLERS ======================
     def on_mouse_down(self, event):
-        self.start_pt = (event.x // SCALE, event.y // SCALE)
+        self.start_pt = (event.x // self.scale, event.y // self.scale)
+        self.last_pt = None
+        if self.tool_var.get() in ('brush', 'eraser'):
+            # Paint the press point; the first drag sample joins back to it
+            self.last_pt = self.start_pt
+            self.stroke([self.start_pt])
         
     def on_mouse_move(self, event):
-        if not self.start_pt:
+        if not self.start_pt or self.last_pt is None:
+            return
+            
+        x, y = event.x // self.scale, event.y // self.scale
+        if (x, y) == self.last_pt:
             return
+        
+        # Join this sample to the previous one so fast drags leave no gaps
+        points = list(line_points(*self.last_pt, x, y))[1:]
+        self.last_pt = (x, y)
+        self.stroke(points)
             
-        x, y = event.x // SCALE, event.y // SCALE
+    def stroke(self, points):
+        """Paint brush or eraser dabs at each point of a stroke"""
         tool = self.tool_var.get()
+        color = self.get_current_color() if tool == 'brush' else (0, 0, 0)
+        for px, py in points:
+            if tool == 'brush':
+                self.apply_brush(px, py, color)
+            else:
+                self.apply_brush_color(px, py, color)
         
-        if tool == 'brush':
-            self.apply_brush(x, y)
-        elif tool == 'eraser':
-            self.apply_brush_color(x, y, (0, 0, 0))
+        if self.params['live_stroke']:
+            self.send_to_matrix()   # one frame per LED slot, however many events
             
     def on_mouse_up(self, event):
         if not self.start_pt:
             return
             
-        x1, y1 = event.x // SCALE, event.y // SCALE
+        x1, y1 = event.x // self.scale, event.y // self.scale
         x0, y0 = self.start_pt
         tool = self.tool_var.get()
         color = self.get_current_color()
@@ -552,33 +2379,18 @@ class MatrixPainter:
         pass
         
     def apply_brush_color(self, x, y, color):
-        size = self.brush_size.get()
+        size = self.params['brush_size']
         for dy in range(-size//2, size//2 + 1):
             for dx in range(-size//2, size//2 + 1):
                 if dx*dx + dy*dy <= (size//2)**2:
                     px, py = x + dx, y + dy
-                    if 0 <= px < COLS and 0 <= py < ROWS:
-                        self.draw_square(px, py, color, self.show_on_screen.get())
+                    if 0 <= px < self.cols and 0 <= py < self.rows:
+                        self.draw_square(px, py, color, self.params['show_on_screen'])
                         
     # ====================== SHAPE METHODS ======================
     def draw_line(self, x0, y0, x1, y1, color):
-        dx = abs(x1 - x0)
-        sx = 1 if x0 < x1 else -1
-        dy = -abs(y1 - y0)
-        sy = 1 if y0 < y1 else -1
-        err = dx + dy
-        
-        while True:
-            self.draw_square(x0, y0, color, self.show_on_screen.get())
-            if x0 == x1 and y0 == y1:
-                break
-            e2 = 2 * err
-            if e2 >= dy:
-                err += dy
-                x0 += sx
-            if e2 <= dx:
-                err += dx
-                y0 += sy
+        for x, y in line_points(x0, y0, x1, y1):
+            self.draw_square(x, y, color, self.params['show_on_screen'])
                 
     def draw_rect(self, x0, y0, x1, y1, color):
         if x0 > x1:
@@ -586,13 +2398,14 @@ class MatrixPainter:
         if y0 > y1:
             y0, y1 = y1, y0
         
-        # Draw rectangle outline
-        for x in range(x0, x1 + 1):
-            self.draw_square(x, y0, color, self.show_on_screen.get())
-            self.draw_square(x, y1, color, self.show_on_screen.get())
-        for y in range(y0, y1 + 1):
-            self.draw_square(x0, y, color, self.show_on_screen.get())
-            self.draw_square(x1, y, color, self.show_on_screen.get())
+        # Draw rectangle outline, one edge at a time
+        width, height = x1 - x0 + 1, y1 - y0 + 1
+        self.frame.fill(color, x0, y0, width, 1)
+        self.frame.fill(color, x0, y1, width, 1)
+        self.frame.fill(color, x0, y0, 1, height)
+        self.frame.fill(color, x1, y0, 1, height)
+        if self.params['show_on_screen']:
+            self.request_preview()
             
     def draw_circle(self, cx, cy, r, color):
         x = r
@@ -607,7 +2420,7 @@ class MatrixPainter:
             ]
             
             for px, py in points:
-                self.draw_square(px, py, color, self.show_on_screen.get())
+                self.draw_square(px, py, color, self.params['show_on_screen'])
                 
             y += 1
             err += 1 + 2*y
@@ -616,32 +2429,30 @@ class MatrixPainter:
                 err += 1 - 2*x
                 
     def flood_fill(self, x, y, new_color):
-        if not (0 <= x < COLS and 0 <= y < ROWS):
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
             return
             
-        old_color = get_pixel(x, y)
+        old_color = self.frame.get(x, y)
         if old_color == new_color:
             return
             
         stack = [(x, y)]
         while stack:
             cx, cy = stack.pop()
-            if not (0 <= cx < COLS and 0 <= cy < ROWS):
+            if not (0 <= cx < self.cols and 0 <= cy < self.rows):
                 continue
-            if get_pixel(cx, cy) != old_color:
+            if self.frame.get(cx, cy) != old_color:
                 continue
                 
-            self.draw_square(cx, cy, new_color, self.show_on_screen.get())
+            self.draw_square(cx, cy, new_color, self.params['show_on_screen'])
             
             stack.extend([(cx+1, cy), (cx-1, cy), (cx, cy+1), (cx, cy-1)])
             
     # ====================== UTILITY METHODS ======================
     def clear_matrix(self):
-        global frame
-        frame = bytearray(ROWS * COLS * 3)
-        for y in range(ROWS):
-            for x in range(COLS):
-                self.draw_square(x, y, (0, 0, 0), self.show_on_screen.get())
+        self.frame.clear()
+        if self.params['show_on_screen']:
+            self.update_canvas()
         self.send_to_matrix()
         
     def undo_last(self):
@@ -653,19 +2464,12 @@ class MatrixPainter:
     # ====================== USER DRAWING ANIMATION ======================
     def capture_current_drawing(self):
         """Capture the current drawing for animation"""
-        self.captured_drawing = []
-        
-        # Store all non-black pixels with their positions and colors
-        for y in range(ROWS):
-            for x in range(COLS):
-                r, g, b = get_pixel(x, y)
-                if r > 0 or g > 0 or b > 0:  # Non-black pixel
-                    self.captured_drawing.append({
-                        'x': x, 'y': y, 'color': (r, g, b)
-                    })
-        
-        if self.captured_drawing:
-            self.captured_lbl.config(text=f"Captured {len(self.captured_drawing)} pixels")
+        # Keep the whole frame; the animations move it as one block
+        count = int(np.count_nonzero(self.frame.pixels.any(axis=2)))
+        self.captured_drawing = self.frame.pixels.copy() if count else None
+        
+        if count:
+            self.captured_lbl.config(text=f"Captured {count} pixels")
         else:
             self.captured_lbl.config(text="No drawing found to capture")
             
@@ -676,7 +2480,7 @@ class MatrixPainter:
         
     def start_drawing_animation(self):
         """Start moving the captured drawing based on direction vectors"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
@@ -685,11 +2489,11 @@ class MatrixPainter:
         self.animation_offset_x = 0.0
         self.animation_offset_y = 0.0
         self.status_lbl.config(text='Moving drawing...')
-        self.move_drawing_step()
+        self.clock.start(self.move_drawing_step)
         
     def keep_alive_animation(self):
         """Keep the animation running continuously (loop)"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
@@ -698,57 +2502,41 @@ class MatrixPainter:
         self.animation_offset_x = 0.0
         self.animation_offset_y = 0.0
         self.status_lbl.config(text='Drawing moving (keep alive)...')
-        self.move_drawing_step()
+        self.clock.start(self.move_drawing_step)
         
     def move_drawing_step(self):
         """Move the captured drawing one step"""
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        # Clear the matrix
-        self.clear_matrix_silent()
-        
         # Calculate movement
-        dx = self.direction_x.get() * self.anim_speed.get() * 0.1
-        dy = self.direction_y.get() * self.anim_speed.get() * 0.1
+        dx = self.params['direction_x'] * self.params['anim_speed'] * 0.1
+        dy = self.params['direction_y'] * self.params['anim_speed'] * 0.1
         
         self.animation_offset_x += dx
         self.animation_offset_y += dy
         
-        # Draw the captured drawing at new position
-        drawing_visible = False
-        for pixel in self.captured_drawing:
-            new_x = int(pixel['x'] + self.animation_offset_x) % COLS
-            new_y = int(pixel['y'] + self.animation_offset_y) % ROWS
-            
-            # Handle wrapping for continuous movement
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                drawing_visible = True
-                
+        # The drawing wraps around the edges, so it never leaves the matrix
+        self.draw_captured(self.animation_offset_x, self.animation_offset_y)
         self.send_to_matrix()
         
-        # Continue animation if keep_alive or if drawing is still visible
-        if self.keep_alive or drawing_visible:
-            delay = max(10, int(100 / self.anim_speed.get()))
-            self.root.after(delay, self.move_drawing_step)
-        else:
-            self.animation_running = False
-            self.status_lbl.config(text='Animation finished')
-            
-    def clear_matrix_silent(self):
-        """Clear matrix without updating status or recording"""
-        global frame
-        frame = bytearray(ROWS * COLS * 3)
-        if self.show_on_screen.get():
-            for y in range(ROWS):
-                for x in range(COLS):
-                    self.draw_square(x, y, (0, 0, 0), True)
+        delay = max(10, int(100 / self.params['anim_speed']))
+        return self.step_delay(delay)
+            
+    def draw_captured(self, dx, dy):
+        """Draw the captured drawing moved by (dx, dy) pixels over the whole
+        frame; what leaves one edge comes back at the other"""
+        x, y = math.floor(dx) % self.cols, math.floor(dy) % self.rows
+        for bx in (x, x - self.cols):
+            for by in (y, y - self.rows):
+                self.frame.blit(self.captured_drawing, bx, by)
+        if self.params['show_on_screen']:
+            self.request_preview()
                     
     # ====================== PATTERN ANIMATIONS ======================
     def animate_bounce_horizontal(self):
         """Make drawing bounce horizontally"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
@@ -756,35 +2544,27 @@ class MatrixPainter:
         self.keep_alive = True
         self.animation_time = 0
         self.status_lbl.config(text='Bouncing horizontally...')
-        self.bounce_horizontal_step()
+        self.clock.start(self.bounce_horizontal_step)
         
     def bounce_horizontal_step(self):
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        self.clear_matrix_silent()
-        
         # Calculate bounce position
-        bounce_range = COLS - 1
-        position = (math.sin(self.animation_time * self.anim_speed.get() * 0.1) + 1) * bounce_range / 2
+        bounce_range = self.cols - 1
+        position = (math.sin(self.animation_time * self.params['anim_speed'] * 0.1) + 1) * bounce_range / 2
         offset_x = position
         
-        for pixel in self.captured_drawing:
-            new_x = int(pixel['x'] + offset_x) % COLS
-            new_y = pixel['y']
-            
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                
+        self.draw_captured(offset_x, 0)
         self.send_to_matrix()
         self.animation_time += 1
         
-        delay = max(10, int(100 / self.anim_speed.get()))
-        self.root.after(delay, self.bounce_horizontal_step)
+        delay = max(10, int(100 / self.params['anim_speed']))
+        return self.step_delay(delay)
         
     def animate_bounce_vertical(self):
         """Make drawing bounce vertically"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
@@ -792,34 +2572,26 @@ class MatrixPainter:
         self.keep_alive = True
         self.animation_time = 0
         self.status_lbl.config(text='Bouncing vertically...')
-        self.bounce_vertical_step()
+        self.clock.start(self.bounce_vertical_step)
         
     def bounce_vertical_step(self):
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        self.clear_matrix_silent()
-        
-        bounce_range = ROWS - 1
-        position = (math.sin(self.animation_time * self.anim_speed.get() * 0.1) + 1) * bounce_range / 2
+        bounce_range = self.rows - 1
+        position = (math.sin(self.animation_time * self.params['anim_speed'] * 0.1) + 1) * bounce_range / 2
         offset_y = position
         
-        for pixel in self.captured_drawing:
-            new_x = pixel['x']
-            new_y = int(pixel['y'] + offset_y) % ROWS
-            
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                
+        self.draw_captured(0, offset_y)
         self.send_to_matrix()
         self.animation_time += 1
         
-        delay = max(10, int(100 / self.anim_speed.get()))
-        self.root.after(delay, self.bounce_vertical_step)
+        delay = max(10, int(100 / self.params['anim_speed']))
+        return self.step_delay(delay)
         
     def animate_circular(self):
         """Make drawing move in a circle"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
@@ -827,40 +2599,30 @@ class MatrixPainter:
         self.keep_alive = True
         self.animation_time = 0
         self.status_lbl.config(text='Circular motion...')
-        self.circular_step()
+        self.clock.start(self.circular_step)
         
     def circular_step(self):
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        self.clear_matrix_silent()
-        
         # Calculate circular position
-        radius_x = COLS / 4
-        radius_y = ROWS / 4
-        center_x = COLS / 2
-        center_y = ROWS / 2
+        radius_x = self.cols / 4
+        radius_y = self.rows / 4
         
-        angle = self.animation_time * self.anim_speed.get() * 0.1
+        angle = self.animation_time * self.params['anim_speed'] * 0.1
         offset_x = math.cos(angle) * radius_x
         offset_y = math.sin(angle) * radius_y
         
-        for pixel in self.captured_drawing:
-            new_x = int(pixel['x'] + offset_x + center_x - COLS/2) % COLS
-            new_y = int(pixel['y'] + offset_y + center_y - ROWS/2) % ROWS
-            
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                
+        self.draw_captured(offset_x, offset_y)
         self.send_to_matrix()
         self.animation_time += 1
         
-        delay = max(10, int(100 / self.anim_speed.get()))
-        self.root.after(delay, self.circular_step)
+        delay = max(10, int(100 / self.params['anim_speed']))
+        return self.step_delay(delay)
         
     def animate_figure8(self):
         """Make drawing move in a figure-8 pattern"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
@@ -868,98 +2630,80 @@ class MatrixPainter:
         self.keep_alive = True
         self.animation_time = 0
         self.status_lbl.config(text='Figure-8 pattern...')
-        self.figure8_step()
+        self.clock.start(self.figure8_step)
         
     def figure8_step(self):
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        self.clear_matrix_silent()
-        
         # Figure-8 equations
-        t = self.animation_time * self.anim_speed.get() * 0.05
-        scale_x = COLS / 6
-        scale_y = ROWS / 4
+        t = self.animation_time * self.params['anim_speed'] * 0.05
+        scale_x = self.cols / 6
+        scale_y = self.rows / 4
         
         offset_x = math.sin(t) * scale_x
         offset_y = math.sin(2 * t) * scale_y
         
-        for pixel in self.captured_drawing:
-            new_x = int(pixel['x'] + offset_x + COLS/2 - pixel['x']) % COLS
-            new_y = int(pixel['y'] + offset_y + ROWS/2 - pixel['y']) % ROWS
-            
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                
+        self.draw_captured(offset_x, offset_y)
         self.send_to_matrix()
         self.animation_time += 1
         
-        delay = max(10, int(100 / self.anim_speed.get()))
-        self.root.after(delay, self.figure8_step)
+        delay = max(10, int(100 / self.params['anim_speed']))
+        return self.step_delay(delay)
         
     def animate_spiral_in(self):
         """Make drawing spiral inward"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
         self.animation_running = True
         self.animation_time = 0
         self.status_lbl.config(text='Spiraling in...')
-        self.spiral_in_step()
+        self.clock.start(self.spiral_in_step)
         
     def spiral_in_step(self):
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        self.clear_matrix_silent()
-        
         # Spiral inward
-        max_radius = max(COLS, ROWS) / 2
-        current_radius = max_radius * (1 - self.animation_time * self.anim_speed.get() * 0.01)
+        max_radius = max(self.cols, self.rows) / 2
+        current_radius = max_radius * (1 - self.animation_time * self.params['anim_speed'] * 0.01)
         
         if current_radius <= 0:
             self.animation_running = False
             self.status_lbl.config(text='Spiral complete')
             return
             
-        angle = self.animation_time * self.anim_speed.get() * 0.2
+        angle = self.animation_time * self.params['anim_speed'] * 0.2
         offset_x = math.cos(angle) * current_radius
         offset_y = math.sin(angle) * current_radius
         
-        for pixel in self.captured_drawing:
-            new_x = int(pixel['x'] + offset_x + COLS/2 - pixel['x']) % COLS
-            new_y = int(pixel['y'] + offset_y + ROWS/2 - pixel['y']) % ROWS
-            
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                
+        self.draw_captured(offset_x, offset_y)
         self.send_to_matrix()
         self.animation_time += 1
         
-        delay = max(10, int(100 / self.anim_speed.get()))
-        self.root.after(delay, self.spiral_in_step)
+        delay = max(10, int(100 / self.params['anim_speed']))
+        return self.step_delay(delay)
         
     def animate_spiral_out(self):
         """Make drawing spiral outward"""
-        if not self.captured_drawing:
+        if self.captured_drawing is None:
             messagebox.showinfo("No Drawing", "Capture a drawing first")
             return
             
         self.animation_running = True
         self.animation_time = 0
         self.status_lbl.config(text='Spiraling out...')
-        self.spiral_out_step()
+        self.clock.start(self.spiral_out_step)
         
     def spiral_out_step(self):
-        if not self.animation_running or not self.captured_drawing:
+        if not self.animation_running or self.captured_drawing is None:
             return
             
-        self.clear_matrix_silent()
-        
         # Spiral outward
-        max_radius = max(COLS, ROWS)
-        current_radius = self.animation_time * self.anim_speed.get() * 0.1
+        max_radius = max(self.cols, self.rows)
+        current_radius = self.animation_time * self.params['anim_speed'] * 0.1
         
         if current_radius > max_radius:
             if self.keep_alive:
@@ -970,256 +2714,82 @@ class MatrixPainter:
                 self.status_lbl.config(text='Spiral complete')
                 return
             
-        angle = self.animation_time * self.anim_speed.get() * 0.2
+        angle = self.animation_time * self.params['anim_speed'] * 0.2
         offset_x = math.cos(angle) * current_radius
         offset_y = math.sin(angle) * current_radius
         
-        for pixel in self.captured_drawing:
-            new_x = int(pixel['x'] + offset_x + COLS/2 - pixel['x']) % COLS
-            new_y = int(pixel['y'] + offset_y + ROWS/2 - pixel['y']) % ROWS
-            
-            if 0 <= new_x < COLS and 0 <= new_y < ROWS:
-                self.draw_square(new_x, new_y, pixel['color'], self.show_on_screen.get())
-                
+        self.draw_captured(offset_x, offset_y)
         self.send_to_matrix()
         self.animation_time += 1
         
     def stop_animation(self):
         """Stop any running animation"""
+        self.clock.stop()
         self.animation_running = False
         self.keep_alive = False
         self.status_lbl.config(text='Animation stopped')
         
     # ====================== ADVANCED EFFECTS ======================
-    def effect_rainbow_wave(self):
-        self.animation_running = True
-        self.status_lbl.config(text='Rainbow wave effect running')
-        self.rainbow_offset = 0
-        self.rainbow_wave_step()
-        
-    def rainbow_wave_step(self):
-        if not self.animation_running:
-            return
-            
-        for y in range(ROWS):
-            for x in range(COLS):
-                # Create wave pattern
-                wave = math.sin((x + self.rainbow_offset) * 0.5) * 0.5 + 0.5
-                hue = (wave + y * 0.1) % 1.0
-                
-                r, g, b = colorsys.hsv_to_rgb(hue, 1.0, self.effect_intensity.get() / 255)
-                color = (int(r * 255), int(g * 255), int(b * 255))
-                
-                self.draw_square(x, y, color, self.show_on_screen.get())
-                
-        self.send_to_matrix()
-        self.rainbow_offset += self.effect_speed.get() * 0.1
-        
-        delay = max(10, int(1000 / self.effect_speed.get()))
-        self.root.after(delay, self.rainbow_wave_step)
-        
-    def effect_plasma(self):
-        self.animation_running = True
-        self.status_lbl.config(text='Plasma effect running')
-        self.plasma_time = 0
-        self.plasma_step()
-        
-    def plasma_step(self):
-        if not self.animation_running:
-            return
-            
-        scale = self.effect_scale.get()
-        
-        for y in range(ROWS):
-            for x in range(COLS):
-                # Plasma algorithm
-                v1 = math.sin(x * scale * 0.1 + self.plasma_time)
-                v2 = math.sin(y * scale * 0.1 + self.plasma_time)
-                v3 = math.sin((x + y) * scale * 0.1 + self.plasma_time)
-                v4 = math.sin(math.sqrt(x*x + y*y) * scale * 0.1 + self.plasma_time)
-                
-                plasma = (v1 + v2 + v3 + v4) / 4
-                hue = (plasma + 1) / 2  # Normalize to 0-1
-                
-                r, g, b = colorsys.hsv_to_rgb(hue, 1.0, self.effect_intensity.get() / 255)
-                color = (int(r * 255), int(g * 255), int(b * 255))
-                
-                self.draw_square(x, y, color, self.show_on_screen.get())
-                
-        self.send_to_matrix()
-        self.plasma_time += self.effect_speed.get() * 0.01
-        
-        delay = max(10, int(1000 / self.effect_speed.get()))
-        self.root.after(delay, self.plasma_step)
-        
-    def effect_fire(self):
-        self.animation_running = True
-        self.status_lbl.config(text='Fire effect running')
-        self.fire_buffer = [[0 for _ in range(COLS)] for _ in range(ROWS + 1)]
-        self.fire_step()
-        
-    def fire_step(self):
-        if not self.animation_running:
-            return
-            
-        # Add heat at bottom
-        for x in range(COLS):
-            self.fire_buffer[ROWS][x] = random.randint(0, int(self.effect_intensity.get()))
-            
-        # Propagate heat upward
-        for y in range(ROWS):
-            for x in range(COLS):
-                heat = 0
-                count = 0
-                
-                # Average surrounding pixels
-                for dx in [-1, 0, 1]:
-                    for dy in [0, 1]:
-                        nx, ny = x + dx, y + dy
-                        if 0 <= nx < COLS and 0 <= ny <= ROWS:
-                            heat += self.fire_buffer[ny][nx]
-                            count += 1
-                            
-                # Cool down and set new heat
-                self.fire_buffer[y][x] = max(0, heat // count - random.randint(0, 3))
-                
-                # Convert heat to color
-                heat_val = self.fire_buffer[y][x]
-                if heat_val < 64:
-                    color = (heat_val * 4, 0, 0)
-                elif heat_val < 128:
-                    color = (255, (heat_val - 64) * 4, 0)
-                else:
-                    color = (255, 255, (heat_val - 128) * 2)
-                    
-                self.draw_square(x, y, color, self.show_on_screen.get())
-                
-        self.send_to_matrix()
-        
-        delay = max(50, int(1000 / self.effect_speed.get()))
-        self.root.after(delay, self.fire_step)
-        
-    def effect_matrix_rain(self):
+    def render_effect(self, name, t, step=None, **params):
+        """Draw one frame of an EFFECTS entry straight into the frame buffer.
+
+        With the per-frame time `step`, effects with a period replay from the
+        cache.
+        """
+        effect = EFFECTS[name]
+        out = self.frame.pixels
+        drawn = (self.effect_cache.render(name, self.effect_grid, t, params,
+                                          step, out)
+                 if step and self.params['bake_effects'] else None)
+        if drawn is None:
+            self.band_renderer.render(effect, t, params, out)
+        if self.params['show_on_screen']:
+            self.request_preview()
+        
+    def start_effect(self, name):
+        """Play a registered effect with a time_step from its schema's sliders"""
         self.animation_running = True
-        self.status_lbl.config(text='Matrix rain effect running')
-        self.rain_drops = []
-        
-        # Initialize rain drops
-        for _ in range(COLS // 2):
-            self.rain_drops.append({
-                'x': random.randint(0, COLS - 1),
-                'y': random.randint(-ROWS, 0),
-                'speed': random.uniform(0.5, 2.0),
-                'brightness': random.randint(64, 255)
-            })
-            
-        self.matrix_rain_step()
+        self.status_lbl.config(text=f'{EFFECTS[name].label} effect running')
+        self.effect_name = name
+        self.effect_time = 0
+        self.clock.start(self.effect_step)
         
-    def matrix_rain_step(self):
+    def effect_step(self):
         if not self.animation_running:
             return
             
-        # Fade all pixels
-        for y in range(ROWS):
-            for x in range(COLS):
-                r, g, b = get_pixel(x, y)
-                r = int(r * 0.9)
-                g = int(g * 0.9)
-                b = int(b * 0.9)
-                self.draw_square(x, y, (r, g, b), False)
-                
-        # Update rain drops
-        for drop in self.rain_drops:
-            drop['y'] += drop['speed']
-            
-            # Draw trail
-            for trail in range(3):
-                y_pos = int(drop['y'] - trail)
-                if 0 <= y_pos < ROWS:
-                    brightness = drop['brightness'] * (1.0 - trail * 0.3)
-                    color = (0, int(brightness), 0)  # Green matrix style
-                    self.draw_square(drop['x'], y_pos, color, False)
-                    
-            # Reset if off screen
-            if drop['y'] > ROWS + 3:
-                drop['y'] = random.randint(-ROWS, 0)
-                drop['x'] = random.randint(0, COLS - 1)
-                drop['speed'] = random.uniform(0.5, 2.0)
-                drop['brightness'] = random.randint(64, 255)
-                
-        if self.show_on_screen.get():
-            self.update_canvas()
+        effect = EFFECTS[self.effect_name]
+        speed = self.params['effect_speed']
+        step = speed * effect.time_step
+        params = effect.params(self.params.snapshot())
+        self.render_effect(effect.name, self.effect_time, step, **params)
         self.send_to_matrix()
+        self.effect_time += step
         
-        delay = max(50, int(1000 / self.effect_speed.get()))
-        self.root.after(delay, self.matrix_rain_step)
+        delay = max(10, int(1000 / speed))
+        return self.step_delay(delay)
         
-    def effect_sparkles(self):
+    def start_simulation(self, name):
+        """Play a registered simulation from a fresh state"""
         self.animation_running = True
-        self.status_lbl.config(text='Sparkles effect running')
-        self.sparkles_step()
+        self.status_lbl.config(text=f'{SIMULATIONS[name].label} effect running')
+        self.simulation = SIMULATIONS[name]
+        self.simulation_state = self.simulation.make(self.rows, self.cols)
+        self.clock.start(self.simulation_step)
         
-    def sparkles_step(self):
+    def simulation_step(self):
         if not self.animation_running:
             return
             
-        # Fade all pixels
-        for y in range(ROWS):
-            for x in range(COLS):
-                r, g, b = get_pixel(x, y)
-                r = int(r * 0.95)
-                g = int(g * 0.95)
-                b = int(b * 0.95)
-                self.draw_square(x, y, (r, g, b), False)
-                
-        # Add new sparkles
-        num_sparkles = max(1, int(self.effect_intensity.get() / 32))
-        for _ in range(num_sparkles):
-            x = random.randint(0, COLS - 1)
-            y = random.randint(0, ROWS - 1)
-            
-            # Random bright color
-            hue = random.random()
-            r, g, b = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
-            color = (int(r * 255), int(g * 255), int(b * 255))
-            
-            self.draw_square(x, y, color, False)
-            
-        if self.show_on_screen.get():
-            self.update_canvas()
+        params = self.simulation.params(self.params.snapshot())
+        self.simulation_state.step(params, self.frame.pixels)
+        if self.params['show_on_screen']:
+            self.request_preview()
         self.send_to_matrix()
         
-        delay = max(50, int(1000 / self.effect_speed.get()))
-        self.root.after(delay, self.sparkles_step)
-        
-    def effect_color_morph(self):
-        self.animation_running = True
-        self.status_lbl.config(text='Color morph effect running')
-        self.morph_time = 0
-        self.color_morph_step()
-        
-    def color_morph_step(self):
-        if not self.animation_running:
-            return
-            
-        # Create morphing colors based on position and time
-        for y in range(ROWS):
-            for x in range(COLS):
-                # Calculate morphing hue
-                distance = math.sqrt((x - COLS/2)**2 + (y - ROWS/2)**2)
-                hue = (distance * 0.1 + self.morph_time) % 1.0
-                
-                r, g, b = colorsys.hsv_to_rgb(hue, 1.0, self.effect_intensity.get() / 255)
-                color = (int(r * 255), int(g * 255), int(b * 255))
-                
-                self.draw_square(x, y, color, self.show_on_screen.get())
-                
-        self.send_to_matrix()
-        self.morph_time += self.effect_speed.get() * 0.01
+        delay = max(50, int(1000 / self.params['effect_speed']))
+        return self.step_delay(delay)
         
-        delay = max(10, int(1000 / self.effect_speed.get()))
-        self.root.after(delay, self.color_morph_step)
-
     def effect_corner_rainbow(self):
         self.animation_running = True
         self.status_lbl.config(text='Corner Rainbow effect running')
@@ -1228,14 +2798,14 @@ class MatrixPainter:
         self.corner_effect_fade_level = 255
         self.corner_effect_fading_out = False
         self.corner_effect_last_switch_time = time.time()
-        self.corner_rainbow_step()
+        self.clock.start(self.corner_rainbow_step)
 
     def corner_rainbow_step(self):
         if not self.animation_running:
             return
 
         self.animation_time += 1
-        t = self.animation_time * self.effect_speed.get() * 0.2
+        t = self.animation_time * self.params['effect_speed'] * 0.2
 
         # Pulsing brightness (breathing effect)
         # beatsin8(6, 180, 255) -> 6 BPM sine wave between 180 and 255
@@ -1263,33 +2833,15 @@ class MatrixPainter:
                 self.corner_effect_fade_level = 255
                 self.corner_effect_last_switch_time = time.time()
 
-        # Draw rainbow from currentCorner
-        for y in range(ROWS):
-            for x in range(COLS):
-                diag = 0
-                if self.corner_effect_current_corner == 0: # Top-Left
-                    diag = x + y
-                elif self.corner_effect_current_corner == 1: # Top-Right
-                    diag = (COLS - 1 - x) + y
-                elif self.corner_effect_current_corner == 2: # Bottom-Left
-                    diag = x + (ROWS - 1 - y)
-                elif self.corner_effect_current_corner == 3: # Bottom-Right
-                    diag = (COLS - 1 - x) + (ROWS - 1 - y)
-
-                hue = ((diag * 12) + t) / 255.0
-                hue = hue - math.floor(hue) # equivalent of & 0xFF
-
-                # Combine fadeLevel and pulse
-                brightness = (pulse / 255.0) * (self.corner_effect_fade_level / 255.0)
-                
-                r, g, b = colorsys.hsv_to_rgb(hue, 1.0, brightness)
-                color = (int(r * 255), int(g * 255), int(b * 255))
-                self.draw_square(x, y, color, self.show_on_screen.get())
-
+        # Draw rainbow from currentCorner, combining fadeLevel and pulse
+        brightness = (pulse / 255.0) * (self.corner_effect_fade_level / 255.0)
+        self.render_effect('corner_rainbow', t,
+                           corner=self.corner_effect_current_corner,
+                           brightness=brightness)
         self.send_to_matrix()
         
         delay = 30 # ms, for ~33 FPS
-        self.root.after(delay, self.corner_rainbow_step)
+        return self.step_delay(delay)
         
     # ====================== FILE OPERATIONS ======================
     def load_image(self):
@@ -1300,14 +2852,10 @@ class MatrixPainter:
             
         try:
             img = Image.open(filename).convert('RGB')
-            img = img.resize((COLS, ROWS), Image.LANCZOS)
-            
-            for y in range(ROWS):
-                for x in range(COLS):
-                    r, g, b = img.getpixel((x, y))
-                    set_pixel(x, y, r, g, b)
+            img = img.resize((self.cols, self.rows), Image.LANCZOS)
+            self.frame.pixels[:] = np.asarray(img)
                     
-            if self.show_on_screen.get():
+            if self.params['show_on_screen']:
                 self.update_canvas()
             self.send_to_matrix()
             
@@ -1322,15 +2870,10 @@ class MatrixPainter:
             return
             
         try:
-            img = Image.new('RGB', (COLS, ROWS))
-            pixels = img.load()
-            
-            for y in range(ROWS):
-                for x in range(COLS):
-                    pixels[x, y] = get_pixel(x, y)
+            img = Image.fromarray(self.frame.pixels.copy())
                     
             # Scale up for better visibility
-            img = img.resize((COLS * 10, ROWS * 10), Image.NEAREST)
+            img = img.resize((self.cols * 10, self.rows * 10), Image.NEAREST)
             img.save(filename)
             
             messagebox.showinfo('Success', f'Saved to {filename}')
@@ -1352,21 +2895,14 @@ class MatrixPainter:
         try:
             images = []
             for frame_data in self.animation_frames:
-                img = Image.new('RGB', (COLS, ROWS))
-                pixels = img.load()
-                
-                for y in range(ROWS):
-                    for x in range(COLS):
-                        i = idx(x, y)
-                        r, g, b = frame_data[i], frame_data[i+1], frame_data[i+2]
-                        pixels[x, y] = (r, g, b)
+                img = Image.fromarray(self.frame.from_wire(frame_data))
                         
                 # Scale up
-                img = img.resize((COLS * 10, ROWS * 10), Image.NEAREST)
+                img = img.resize((self.cols * 10, self.rows * 10), Image.NEAREST)
                 images.append(img)
                 
             # Save as animated GIF
-            duration = max(1, int(1000 / self.anim_speed.get()))
+            duration = max(1, int(1000 / self.params['anim_speed']))
             images[0].save(filename, save_all=True, append_images=images[1:],
                           duration=duration, loop=0)
                           
@@ -1390,24 +2926,20 @@ class MatrixPainter:
             if 'frames' in data:
                 # Load frame-based animation
                 for frame_info in data['frames']:
-                    frame_data = bytearray(ROWS * COLS * 3)
+                    pixels = np.zeros((self.rows, self.cols, 3), np.uint8)
                     
                     if 'data' in frame_info:
                         # Direct frame data
-                        for i, val in enumerate(frame_info['data'][:len(frame_data)]):
-                            frame_data[i] = int(val)
+                        pixels = self.frame.from_wire(
+                            bytes(int(v) for v in frame_info['data']))
                     elif 'pixels' in frame_info:
                         # Pixel-based data
                         for pixel in frame_info['pixels']:
                             x, y = pixel['x'], pixel['y']
-                            r, g, b = pixel['c']
-                            if 0 <= x < COLS and 0 <= y < ROWS:
-                                i = idx(x, y)
-                                frame_data[i] = r
-                                frame_data[i+1] = g
-                                frame_data[i+2] = b
+                            if 0 <= x < self.cols and 0 <= y < self.rows:
+                                pixels[y, x] = pixel['c']
                                 
-                    self.animation_frames.append(frame_data)
+                    self.animation_frames.append(self.frame.to_wire(pixels))
                     
             self.frames_lbl.config(text=f"Frames: {len(self.animation_frames)}")
             messagebox.showinfo('Success', f'Loaded {len(self.animation_frames)} frames')
@@ -1428,7 +2960,7 @@ class MatrixPainter:
             
         try:
             data = {
-                'fps': int(self.anim_speed.get()),
+                'fps': int(self.params['anim_speed']),
                 'frames': []
             }
             
@@ -1457,16 +2989,16 @@ class MatrixPainter:
         try:
             data = {
                 'matrix_info': {
-                    'rows': ROWS,
-                    'cols': COLS,
+                    'rows': self.rows,
+                    'cols': self.cols,
                     'created': datetime.now().isoformat()
                 },
-                'current_frame': list(frame)
+                'current_frame': list(self.frame.to_wire())
             }
             
             if self.animation_frames:
                 data['animation'] = {
-                    'fps': int(self.anim_speed.get()),
+                    'fps': int(self.params['anim_speed']),
                     'frame_count': len(self.animation_frames),
                     'frames': [list(f) for f in self.animation_frames]
                 }
@@ -1480,9 +3012,78 @@ class MatrixPainter:
             messagebox.showerror('Error', f'Failed to export: {e}')
             
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.band_renderer.close()
+
+# ======================  BENCHMARK  ===================
+BENCHMARK_SIZES = ((9, 22), (16, 16), (32, 32), (50, 50), (64, 64), (100, 100))
+
+def benchmark(sizes=BENCHMARK_SIZES, frames=50):
+    """Print the per-frame cost of each stage of the frame pipeline, from
+    the GUI's matrix size up to 10,000 LEDs.
+
+    'render' draws Plasma through a BandRenderer, as the GUI does, so it
+    uses every core on large matrices. 'preview' builds the scaled image
+    preview; uploading it to Tk is not included, as that needs a display.
+    """
+    stages = ('render', 'preview', 'to_wire', 'encode')
+    print(f'{"size":>9} {"LEDs":>6} ' + ' '.join(f'{s:>9}' for s in stages)
+          + f' {"total":>9}   (ms per frame)')
+    for rows, cols in sizes:
+        fb = FrameBuffer(rows, cols)
+        bands = BandRenderer(effect_grid(rows, cols))
+        plasma = EFFECTS['plasma']
+        params = plasma.params()
+        previous = None
+        spent = dict.fromkeys(stages, 0.0)
+        for n in range(frames):
+            t0 = time.perf_counter()
+            bands.render(plasma, n * 0.05, params, fb.pixels)
+            t1 = time.perf_counter()
+            scaled_image(fb.pixels, fit_scale(rows, cols)).tobytes()
+            t2 = time.perf_counter()
+            wire = fb.to_wire()
+            t3 = time.perf_counter()
+            encode_frame(wire, previous)
+            t4 = time.perf_counter()
+            previous = wire
+            for stage, dt in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+                spent[stage] += dt
+        bands.close()
+        ms = [spent[s] * 1000 / frames for s in stages]
+        print(f'{rows:>4}×{cols:<4} {rows * cols:>6} '
+              + ' '.join(f'{v:>9.3f}' for v in ms) + f' {sum(ms):>9.3f}')
 
 # ======================  MAIN ENTRY POINT  ===================
+def main():
+    parser = argparse.ArgumentParser(
+        description='Draw on and animate a WS2812B LED matrix')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='matrix profile: {"rows", "cols", "scale", "wiring"}')
+    parser.add_argument('--rows', type=int)
+    parser.add_argument('--cols', type=int)
+    parser.add_argument('--scale', type=int, help='canvas pixels per LED')
+    parser.add_argument('--wiring', help='wiring name or wiring file')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time the frame pipeline from 9×22 to 100×100, then exit')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+    profile = (load_profile(args.profile) if args.profile else
+               {'rows': ROWS, 'cols': COLS, 'scale': None, 'wiring': WIRING})
+    for key in profile:
+        if getattr(args, key) is not None:
+            profile[key] = getattr(args, key)
+    try:
+        check_profile(profile)
+    except ValueError as e:
+        parser.error(str(e))
+    app = MatrixPainter(**profile)
+    app.run()
+
 if __name__ == '__main__':
-    app = MatrixPainter()
-    app.run()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""Reference DDP receiver for Matrix Painter's UDP transport.
+
+Listens like an ESP32 controller would and reports frame rate, throughput
+and packet loss, so the network path can be measured without hardware:
+
+    python ddp_receiver.py                    # listen on 127.0.0.1:4048
+    python ddp_receiver.py --selftest 5       # also send test frames for 5 s
+"""
+import argparse
+import socket
+import threading
+import time
+
+# ======================  DDP  ======================
+DDP_PORT = 4048
+DDP_HEADER_LEN = 10
+DDP_PUSH = 0x01
+DDP_FLAG_TIMECODE = 0x10   # 4 extra header bytes
+# ===================================================
+
+
+class DdpReceiver:
+    """Reassembles DDP packets into frames and keeps statistics"""
+    def __init__(self, host='127.0.0.1', port=DDP_PORT, leds=198):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.frame = bytearray(leds * 3)
+        self.running = True
+        # Statistics
+        self.packets = 0
+        self.bytes = 0
+        self.frames = 0
+        self.lost_packets = 0      # gaps in the 4-bit sequence numbers
+        self.incomplete = 0        # pushes before the whole frame arrived
+        self._expected_seq = None
+        self._received = 0         # data bytes since the last push
+
+    def run(self):
+        while self.running:
+            try:
+                packet = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.handle(packet)
+
+    def handle(self, packet):
+        if len(packet) < DDP_HEADER_LEN:
+            return
+        flags, seq = packet[0], packet[1] & 0x0F
+        offset = int.from_bytes(packet[4:8], 'big')
+        length = int.from_bytes(packet[8:10], 'big')
+        data_at = DDP_HEADER_LEN + (4 if flags & DDP_FLAG_TIMECODE else 0)
+        data = packet[data_at:data_at + length]
+
+        self.packets += 1
+        self.bytes += len(packet)
+        if seq:
+            if self._expected_seq is not None and seq != self._expected_seq:
+                self.lost_packets += (seq - self._expected_seq) % 15
+            self._expected_seq = seq % 15 + 1
+
+        data = data[:max(0, len(self.frame) - offset)]
+        self.frame[offset:offset + len(data)] = data
+        self._received += len(data)
+        if flags & DDP_PUSH:
+            self.frames += 1
+            if 0 < self._received < len(self.frame):
+                self.incomplete += 1
+            self._received = 0
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+
+
+def report(rx, interval=1.0):
+    """Print one line of statistics per interval until the receiver stops"""
+    last = (time.monotonic(), 0, 0)
+    while rx.running:
+        time.sleep(interval)
+        now = time.monotonic()
+        t0, frames0, bytes0 = last
+        elapsed = now - t0
+        print(f'{(rx.frames - frames0) / elapsed:7.1f} fps  '
+              f'{(rx.bytes - bytes0) / elapsed / 1024:9.1f} kB/s  '
+              f'{rx.packets} packets  {rx.lost_packets} lost  '
+              f'{rx.incomplete} incomplete frames', flush=True)
+        last = (now, rx.frames, rx.bytes)
+
+
+def selftest(host, port, leds, seconds, fps):
+    """Send changing frames through Matrix Painter's own UdpLink"""
+    from Matrix_Painter import UdpLink
+
+    link = UdpLink(host, port)
+    period = 1.0 / fps if fps else 0
+    end = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < end:
+        link.send_frame(bytes([n & 0xFF, 0, 255 - (n & 0xFF)]) * leds)
+        n += 1
+        if period:
+            time.sleep(period)
+    time.sleep(0.2)
+    link.close()
+    print(f'sender: {link.frames_sent} frames sent, {link.frames_dropped} '
+          f'dropped, {link.frames_lost} with packets the OS refused')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DDP_PORT)
+    parser.add_argument('--leds', type=int, default=198,
+                        help='LEDs in one frame (default 9×22)')
+    parser.add_argument('--selftest', type=float, metavar='SECONDS',
+                        help='send test frames to this receiver, then exit')
+    parser.add_argument('--fps', type=float, default=0,
+                        help='self-test frame rate (default: as fast as possible)')
+    args = parser.parse_args()
+
+    rx = DdpReceiver(args.host, args.port, args.leds)
+    threading.Thread(target=rx.run, daemon=True).start()
+    threading.Thread(target=report, args=(rx,), daemon=True).start()
+    try:
+        if args.selftest:
+            selftest(args.host, args.port, args.leds, args.selftest, args.fps)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rx.close()
+    print(f'receiver: {rx.frames} frames, {rx.packets} packets, '
+          f'{rx.lost_packets} lost, {rx.incomplete} incomplete frames')
+
+
+if __name__ == '__main__':
+    main()
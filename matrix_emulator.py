@@ -0,0 +1,442 @@
+"""Software stand-in for MatrixDriver.ino on a pseudo-terminal.
+
+Runs the driver's command decoder and packet framing, and charges the time
+real hardware would need: every byte costs 10 bit times at the current
+baud rate, and every FastLED.show() blocks for the WS2812 data time. Bytes
+that arrive while show() has interrupts off are lost after the UART's
+2-byte FIFO fills, as on an Uno. Matrix Painter connects to the printed
+port like to a real board:
+
+    python matrix_emulator.py                    # prints e.g. /dev/pts/5
+    python matrix_emulator.py --bench 10         # stream test frames for 10 s
+
+POSIX only (uses os.openpty).
+"""
+import argparse
+import binascii
+import os
+import random
+import threading
+import time
+import tty
+
+# ======================  DRIVER CONSTANTS  ======================
+# Keep in step with MatrixDriver.ino
+CMD_FRAME = 0xFF
+CMD_PIXEL = 0x01
+CMD_BRIGHT = 0x02
+CMD_SPANS = 0x03
+CMD_RLE = 0x04
+CMD_PALETTE = 0x05
+CMD_HOLD = 0x06
+CMD_SHOW = 0x07
+CMD_BAUD = 0x08
+CMD_PROBE = 0x09
+CMD_HELLO = 0x0A
+CAPS = 'frame,pixel,bright,spans,rle,palette,hold,show,framed,baud,probe'
+
+SYNC0, SYNC1 = 0xA5, 0x5A
+PROTOCOL_VERSION = 1
+REPLY_ACK = 0x06
+REPLY_NAK = 0x15
+BYTE_TIMEOUT = 0.050
+DEFAULT_BAUD = 115200
+BAUD_FALLBACK = 2.0
+
+UART_FIFO = 2             # bytes the AVR UART keeps while interrupts are off
+LED_US = 30.0             # WS2812: 24 bits × 1.25 µs
+LATCH_US = 50.0           # reset/latch time after the last LED
+# ================================================================
+
+
+class DriverEmulator:
+    """Byte-for-byte model of MatrixDriver.ino's receiveSerial()"""
+    def __init__(self, rows=9, cols=22):
+        self.rows, self.cols = rows, cols
+        self.num_leds = rows * cols
+        # MAX_PAYLOAD: room for a frame, and never less than a probe packet
+        self.max_payload = max(self.num_leds * 3 + 16, 260)
+        self.leds = bytearray(self.num_leds * 3)
+        self.shown = bytes(self.leds)     # what the LEDs display
+        self.palette = bytearray(256 * 3)
+        self.brightness = 32
+        self.replies = bytearray()        # bytes to send back to the host
+        self.shows = 0
+        self.hold = False
+        self._reset_decoder()
+        self._show_pending = False
+        self._pending_bright = None
+        self._show_now = False
+        self.pkt = 'none'
+        self.framed_host = False          # bare commands off after 1st packet
+        self.last_recv = 0.0
+        self.baud = DEFAULT_BAUD
+        self.baud_fallback_at = None      # set while a new rate is unconfirmed
+        self._pending_baud = None
+
+    def banner(self):
+        return (f'MatrixDriver proto={PROTOCOL_VERSION} rows={self.rows} '
+                f'cols={self.cols} caps={CAPS}\r\n').encode()
+
+    def xy(self, x, y):
+        return y * self.cols + (self.cols - 1 - x if y & 1 else x)
+
+    # ---- command decoder ----
+    def _reset_decoder(self):
+        self.state = 'cmd'
+        self.pos = 0
+        self.args = bytearray()
+
+    def _commit(self):
+        if self._pending_bright is not None:
+            self.brightness = self._pending_bright
+            self._pending_bright = None
+            self._show_pending = True
+        shown = False
+        if self._show_pending and (not self.hold or self._show_now):
+            self.shown = bytes(self.leds)
+            self.shows += 1
+            self._show_pending = False
+            shown = True
+        self._show_now = False
+        return shown
+
+    def _discard(self):
+        self._reset_decoder()
+        self._show_pending = False
+        self._pending_bright = None
+        self._show_now = False
+        self._pending_baud = None
+
+    def _switch_baud(self, now):
+        rate, self._pending_baud = self._pending_baud, None
+        if rate == self.baud:
+            self.baud_fallback_at = None      # confirmed
+        else:
+            self.baud = rate
+            self.baud_fallback_at = now + BAUD_FALLBACK
+
+    def _done(self, show=True):
+        if show:
+            self._show_pending = True
+        self.state = 'cmd'
+        return True
+
+    def decode_byte(self, b):
+        """Feed one byte; returns True when a command completed"""
+        s = self.state
+        if s == 'cmd':
+            self.pos = 0
+            self.args = bytearray()
+            self.state = {CMD_FRAME: 'frame', CMD_PIXEL: 'pixel',
+                          CMD_BRIGHT: 'bright', CMD_SPANS: 'span_count',
+                          CMD_RLE: 'rle', CMD_PALETTE: 'pal_count',
+                          CMD_HOLD: 'hold', CMD_SHOW: 'show',
+                          CMD_BAUD: 'baud', CMD_PROBE: 'probe_len'}.get(b, 'cmd')
+            return False
+        if s == 'frame':
+            self.leds[self.pos] = b
+            self.pos += 1
+            return self.pos >= len(self.leds) and self._done()
+        if s == 'pixel':
+            self.args.append(b)
+            if len(self.args) < 5:
+                return False
+            x, y, r, g, bl = self.args
+            if x < self.cols and y < self.rows:
+                i = self.xy(x, y) * 3
+                self.leds[i:i + 3] = bytes((r, g, bl))
+                return self._done()
+            return self._done(show=False)
+        if s == 'bright':
+            self._pending_bright = b
+            return self._done(show=False)
+        if s == 'span_count':
+            self.spans_left = b
+            self.state = 'span_hdr' if b else 'cmd'
+            return not b
+        if s == 'span_hdr':
+            self.args.append(b)
+            if len(self.args) == 3:
+                self.pos = (self.args[0] << 8 | self.args[1]) * 3
+                self.span_left = self.args[2] * 3
+                self.args = bytearray()
+                if self.span_left:
+                    self.state = 'span_data'
+                else:
+                    self.spans_left -= 1
+                    if not self.spans_left:
+                        return self._done()
+            return False
+        if s == 'span_data':
+            if self.pos < len(self.leds):
+                self.leds[self.pos] = b
+            self.pos += 1
+            self.span_left -= 1
+            if not self.span_left:
+                self.spans_left -= 1
+                if not self.spans_left:
+                    return self._done()
+                self.state = 'span_hdr'
+            return False
+        if s == 'rle':
+            self.args.append(b)
+            if len(self.args) == 4:
+                run = min(self.args[0], self.num_leds - self.pos)
+                i = self.pos * 3
+                self.leds[i:i + run * 3] = bytes(self.args[1:]) * run
+                self.pos += run
+                self.args = bytearray()
+                if self.pos >= self.num_leds:
+                    return self._done()
+            return False
+        if s == 'pal_count':
+            self.pal_count = b or 256
+            self.pos = 0
+            self.state = 'pal_colors'
+            return False
+        if s == 'pal_colors':
+            self.palette[self.pos] = b
+            self.pos += 1
+            if self.pos >= self.pal_count * 3:
+                self.pos = 0
+                self.state = 'pal_index'
+            return False
+        if s == 'pal_index':
+            i = self.pos * 3
+            self.leds[i:i + 3] = self.palette[b * 3:b * 3 + 3]
+            self.pos += 1
+            return self.pos >= self.num_leds and self._done()
+        if s == 'hold':
+            self.hold = bool(b)
+            return self._done(show=False)
+        if s == 'show':
+            self._show_now = True
+            return self._done(show=False)
+        if s == 'baud':
+            self.args.append(b)
+            if len(self.args) < 4:
+                return False
+            self._pending_baud = int.from_bytes(self.args, 'big')
+            return self._done(show=False)
+        if s == 'probe_len':
+            self.probe_left = b
+            self.state = 'probe' if b else 'cmd'
+            return not b
+        if s == 'probe':
+            self.probe_left -= 1
+            return not self.probe_left and self._done(show=False)
+        return False
+
+    # ---- packet receiver ----
+    def timeout(self, now):
+        """Drop a packet that stalled half way, like BYTE_TIMEOUT_MS, and
+        revert an unconfirmed baud rate after BAUD_FALLBACK_MS"""
+        if self.baud_fallback_at is not None and now >= self.baud_fallback_at:
+            self.baud = DEFAULT_BAUD
+            self.baud_fallback_at = None
+        if ((self.pkt != 'none' or self.state != 'cmd')
+                and now - self.last_recv > BYTE_TIMEOUT):
+            if self.pkt in ('payload', 'crc'):
+                self.replies += bytes([REPLY_NAK, self.hdr[1]])
+            self._discard()
+            self.pkt = 'none'
+
+    def receive(self, b, now):
+        """Feed one byte that arrived at `now`; returns True if it caused a show"""
+        self.timeout(now)
+        self.last_recv = now
+        p = self.pkt
+        if p == 'none':
+            if self.state == 'cmd' and b == SYNC0:
+                self.pkt = 'sync1'
+            elif self.state == 'cmd' and b == CMD_HELLO:
+                self.replies += self.banner()
+            elif self.framed_host:
+                pass                      # noise between packets
+            elif self.decode_byte(b):
+                self._pending_baud = None
+                return self._commit()
+        elif p == 'sync1':
+            if b == SYNC1:
+                self.hdr = bytearray()
+                self.pkt = 'header'
+            else:
+                self.pkt = 'sync1' if b == SYNC0 else 'none'
+        elif p == 'header':
+            self.hdr.append(b)
+            if len(self.hdr) == 4:
+                self.payload_left = self.hdr[2] << 8 | self.hdr[3]
+                if (self.hdr[0] != PROTOCOL_VERSION
+                        or self.payload_left > self.max_payload):
+                    self.pkt = 'none'
+                else:
+                    self._reset_decoder()
+                    self.body = bytearray(self.hdr)
+                    self.rx_crc = bytearray()
+                    self.pkt = 'payload' if self.payload_left else 'crc'
+        elif p == 'payload':
+            self.body.append(b)
+            self.decode_byte(b)
+            self.payload_left -= 1
+            if not self.payload_left:
+                self.pkt = 'crc'
+        elif p == 'crc':
+            self.rx_crc.append(b)
+            if len(self.rx_crc) == 2:
+                self.pkt = 'none'
+                crc = binascii.crc_hqx(bytes(self.body), 0xFFFF)
+                if (int.from_bytes(self.rx_crc, 'big') == crc
+                        and self.state == 'cmd'):
+                    shown = self._commit()
+                    self.replies += bytes([REPLY_ACK, self.hdr[1]])
+                    self.framed_host = True
+                    self._reset_decoder()
+                    if self._pending_baud:
+                        self._switch_baud(now)
+                    return shown
+                self._discard()
+                self.replies += bytes([REPLY_NAK, self.hdr[1]])
+        return False
+
+
+class PtyBoard:
+    """Serves a DriverEmulator on a pseudo-terminal with realistic timing"""
+    def __init__(self, emulator, max_baud=2000000, led_us=LED_US):
+        self.emu = emulator
+        self.max_baud = max_baud   # faster rates garble bytes, like a cheap
+                                   # USB adapter or a long cable would
+        self.show_time = (emulator.num_leds * led_us + LATCH_US) / 1e6
+        self.master, slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave        # keep open so the pty stays alive
+        self.running = True
+        # Statistics
+        self.bytes_in = 0
+        self.dropped = 0           # bytes lost while show() blocked
+        self.stalls = 0            # shows that had bytes arrive during them
+        self.show_seconds = 0.0
+
+    def run(self):
+        line_free = 0.0            # when the wire finishes the last byte
+        show_end = 0.0
+        in_show = 0                # bytes that arrived during the show
+        os.write(self.master, self.emu.banner())   # setup()
+        while self.running:
+            try:
+                chunk = os.read(self.master, 4096)
+            except OSError:
+                break
+            now = time.monotonic()
+            line_free = max(line_free, now)
+            for b in chunk:
+                line_free += 10.0 / self.emu.baud
+                self.bytes_in += 1
+                if self.emu.baud > self.max_baud and random.random() < 0.2:
+                    b = random.getrandbits(8)
+                if line_free < show_end:
+                    in_show += 1
+                    if in_show == 1:
+                        self.stalls += 1
+                    if in_show > UART_FIFO:
+                        self.dropped += 1
+                        continue
+                at = max(line_free, show_end)
+                if self.emu.receive(b, at):
+                    show_end = at + self.show_time
+                    self.show_seconds += self.show_time
+                    in_show = 0
+                if self.emu.replies:
+                    self._reply(max(at, show_end))
+            if self.emu.replies:
+                self._reply(show_end)
+            # Hold off reading until the wire and show() have caught up, so
+            # the pty fills and the host feels the real line rate
+            delay = max(line_free, show_end) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _reply(self, when):
+        """Send queued replies once the emulated board would have sent them"""
+        delay = when - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        os.write(self.master, bytes(self.emu.replies))
+        self.emu.replies.clear()
+
+    def report(self, interval=1.0):
+        last = (time.monotonic(), 0, 0)
+        while self.running:
+            time.sleep(interval)
+            now = time.monotonic()
+            t0, shows0, bytes0 = last
+            elapsed = now - t0
+            print(f'{(self.emu.shows - shows0) / elapsed:7.1f} fps  '
+                  f'{(self.bytes_in - bytes0) / elapsed / 1024:7.1f} kB/s  '
+                  f'{self.dropped} bytes dropped  {self.stalls} show stalls  '
+                  f'{self.show_seconds:.2f} s in show()  '
+                  f'{self.emu.baud} baud', flush=True)
+            last = (now, self.emu.shows, self.bytes_in)
+
+
+def bench(port, rows, cols, seconds, framed=True):
+    """Stream a moving test pattern through Matrix Painter's SerialLink"""
+    from Matrix_Painter import SerialLink
+
+    link = SerialLink(port, framed=framed)
+    n = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        buf = bytearray(rows * cols * 3)
+        lit = n % (rows * cols)
+        buf[lit * 3:lit * 3 + 3] = b'\xff\x80\x00'
+        buf[::7] = bytes([n & 0xFF]) * len(buf[::7])
+        link.send_frame(buf)
+        n += 1
+        time.sleep(0.001)
+    time.sleep(0.5)
+    link.close()
+    print(f'host: {n} frames rendered, {link.frames_sent} sent, '
+          f'{link.frames_dropped} dropped, {link.frames_lost} lost, '
+          f'{link.baud} baud')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=9)
+    parser.add_argument('--cols', type=int, default=22)
+    parser.add_argument('--max-baud', type=int, default=2000000,
+                        help='fastest rate that works; the board boots at '
+                             f'{DEFAULT_BAUD} and the host negotiates up')
+    parser.add_argument('--led-us', type=float, default=LED_US,
+                        help='show() time per LED in µs (WS2812: 30)')
+    parser.add_argument('--bench', type=float, metavar='SECONDS',
+                        help='drive the emulator from SerialLink, then exit')
+    parser.add_argument('--unframed', action='store_true',
+                        help='bench with bare commands (no packets/credits)')
+    args = parser.parse_args()
+
+    board = PtyBoard(DriverEmulator(args.rows, args.cols), args.max_baud,
+                     args.led_us)
+    print(f'MatrixDriver emulator on {board.port} '
+          f'({args.rows}×{args.cols}, up to {args.max_baud} baud)', flush=True)
+    threading.Thread(target=board.run, daemon=True).start()
+    threading.Thread(target=board.report, daemon=True).start()
+    try:
+        if args.bench:
+            bench(board.port, args.rows, args.cols, args.bench,
+                  framed=not args.unframed)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    board.running = False
+    print(f'board: {board.emu.shows} frames shown, {board.bytes_in} bytes, '
+          f'{board.dropped} dropped, {board.stalls} show stalls')
+
+
+if __name__ == '__main__':
+    main()